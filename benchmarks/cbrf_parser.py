@@ -0,0 +1,34 @@
+"""Compares the streaming CBRF XML parser with the original DOM-based one.
+
+Usage: python benchmarks/cbrf_parser.py [ITERATIONS]
+"""
+
+import os
+import sys
+import timeit
+
+ROOT_PATH = os.path.join(os.path.dirname(__file__), os.pardir)
+sys.path.insert(0, ROOT_PATH)
+
+from pydeposits import cbrf
+from tests.test_cbrf import parse_with_minidom
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    with open(os.path.join(ROOT_PATH, "tests", "cbrf_daily.xml"), "rb") as xml_file:
+        xml_contents = xml_file.read()
+
+    print("{} iterations over a {} bytes response.".format(iterations, len(xml_contents)))
+
+    for name, parse in (
+        ("minidom", parse_with_minidom),
+        ("iterparse", cbrf.parse_daily_rates),
+    ):
+        elapsed = timeit.timeit(lambda: parse(xml_contents), number=iterations)
+        print("{:>9}: {:6.1f} us per response.".format(name, elapsed / iterations * 10 ** 6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Measures memory and time spent on deposit statement of a large portfolio.
+
+Generates synthetic holdings and reports memory occupied by them as plain
+dicts (the way they're specified by the user) and as Holding records, and
+time and peak memory usage (measured in a separate run, since tracing slows
+it down) of get_account_statement() for them.
+
+Usage: python benchmarks/holding_records.py [HOLDINGS]
+"""
+
+import datetime
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pydeposits import deposits, statements
+from pydeposits.rate_archive import RateArchive
+
+from synthetic import generate_deposits, generate_rates
+
+CURRENCIES = ("USD", "EUR", "RUR")
+START_DATE = datetime.date(2010, 1, 1)
+DAYS = 6 * 365
+
+
+def main():
+    holding_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    today = datetime.date(2016, 1, 1)
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        RateArchive.set_db_dir(db_dir)
+        RateArchive.enable_offline_mode(True)
+        generate_rates(RateArchive(), CURRENCIES, START_DATE, DAYS)
+
+        print("{} holdings:".format(holding_count))
+
+        tracemalloc.start()
+        _measure("dicts", lambda: generate_deposits(holding_count, CURRENCIES, START_DATE, DAYS))
+        holdings = _measure("records", lambda: [deposits._get_holding(deposit) for deposit in generate_deposits(
+            holding_count, CURRENCIES, START_DATE, DAYS)])
+        tracemalloc.stop()
+
+        for vectorized in (False, True):
+            if vectorized and not statements.vectorized.is_available():
+                continue
+
+            statements.VECTORIZED_MIN_HOLDINGS = 1
+            statements.get_account_statement(holdings[:10], today, True, vectorized)
+
+            start_time = time.perf_counter()
+            statements.get_account_statement(holdings, today, True, vectorized)
+            total_time = time.perf_counter() - start_time
+
+            tracemalloc.start()
+            statements.get_account_statement(holdings, today, True, vectorized)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            print("  {:>24}: {:8.1f} ms, peak {:6.1f} MB ({:4.0f} bytes per holding)".format(
+                "statement (vectorized)" if vectorized else "statement", total_time * 1000,
+                peak_memory / 1024 / 1024, peak_memory / holding_count))
+
+
+def _measure(name, generate):
+    start_memory = tracemalloc.get_traced_memory()[0]
+    value = generate()
+    memory = tracemalloc.get_traced_memory()[0] - start_memory
+
+    print("  {:>24}: {:6.1f} MB ({:4.0f} bytes per holding)".format(
+        name, memory / 1024 / 1024, memory / len(value)))
+
+    return value
+
+
+if __name__ == "__main__":
+    main()
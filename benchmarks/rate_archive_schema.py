@@ -0,0 +1,97 @@
+"""Compares the legacy (v1) and the current rate archive database schemas.
+
+Builds a multi-year synthetic archive in both schemas and reports the on-disk
+size and the speed of nearest rate lookups done the same way as
+RateArchive.get_approx() did them before the in-memory index was introduced.
+
+Usage: python benchmarks/rate_archive_schema.py [YEARS] [CURRENCIES]
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pydeposits import rate_archive
+from pydeposits.rate_archive import MIN_RATE_ACCURACY
+
+LOOKUPS = 20000
+
+
+def main():
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    currencies = ["C{:02d}".format(currency_id) for currency_id in range(int(sys.argv[2]) if len(sys.argv) > 2 else 40)]
+    days = range(16000, 16000 + years * 365)
+
+    random.seed(0)
+    rows = [
+        (currency, day, Decimal(random.randrange(10 ** 6, 10 ** 8)).scaleb(-4), Decimal(random.randrange(10 ** 6, 10 ** 8)).scaleb(-4))
+        for currency in currencies for day in days]
+    lookups = [(random.choice(currencies), random.choice(days)) for _ in range(LOOKUPS)]
+
+    print("{} years, {} currencies, {} rows, {} lookups.".format(years, len(currencies), len(rows), LOOKUPS))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, create, lookup in (
+            ("v1", _create_v1, _lookup_v1),
+            ("v{}".format(rate_archive.SCHEMA_VERSION), _create_current, _lookup_current),
+        ):
+            db_path = os.path.join(temp_dir, name + ".sqlite")
+            db = sqlite3.connect(db_path)
+            create(db, rows, os.path.join(temp_dir, name + ".lock"))
+            db.close()
+
+            db = sqlite3.connect(db_path)
+            start_time = time.perf_counter()
+            for currency, day in lookups:
+                lookup(db, currency, day)
+            lookup_time = time.perf_counter() - start_time
+            db.close()
+
+            print("{}: {:8.1f} KB on disk, {:6.1f} us per lookup.".format(
+                name, os.path.getsize(db_path) / 1024, lookup_time / len(lookups) * 10 ** 6))
+
+
+def _create_v1(db, rows, lock_path):
+    db.execute("CREATE TABLE rates (day INTEGER, currency TEXT, sell_rate TEXT, buy_rate TEXT)")
+    db.execute("CREATE INDEX rate_index ON rates (day, currency)")
+    db.executemany("INSERT INTO rates VALUES (?, ?, ?, ?)", [
+        (day, currency, str(sell_rate), str(buy_rate)) for currency, day, sell_rate, buy_rate in rows])
+    db.commit()
+
+
+def _create_current(db, rows, lock_path):
+    rate_archive._init_db(db, lock_path)
+    db.executemany("INSERT INTO rates VALUES (?, ?, ?, ?)", [
+        (currency, day, rate_archive._to_fixed_point(sell_rate), rate_archive._to_fixed_point(buy_rate))
+        for currency, day, sell_rate, buy_rate in rows])
+    db.commit()
+
+
+def _lookup_v1(db, currency, day):
+    return _nearest(day, [
+        (rate_day, Decimal(sell_rate), Decimal(buy_rate)) for rate_day, sell_rate, buy_rate in db.execute(
+            "SELECT day, sell_rate, buy_rate FROM rates WHERE currency = ? AND ? <= day AND day <= ?",
+            (currency, day - MIN_RATE_ACCURACY, day + MIN_RATE_ACCURACY))])
+
+
+def _lookup_current(db, currency, day):
+    return _nearest(day, [
+        (rate_day, rate_archive._from_fixed_point(sell_rate), rate_archive._from_fixed_point(buy_rate))
+        for rate_day, sell_rate, buy_rate in db.execute(
+            "SELECT day, sell_rate, buy_rate FROM rates WHERE currency = ? AND ? <= day AND day <= ?",
+            (currency, day - MIN_RATE_ACCURACY, day + MIN_RATE_ACCURACY))])
+
+
+def _nearest(day, rates):
+    return min(rates, key=lambda rate: abs(day - rate[0]), default=None)
+
+
+if __name__ == "__main__":
+    main()
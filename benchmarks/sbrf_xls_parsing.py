@@ -0,0 +1,86 @@
+"""Compares the default and the lean loading modes of Sberbank *.xls files.
+
+Parses every tests/sberbank_*.xls fixture the way _SberbankRates.parse()
+does it (xlrd's default options, all sheets loaded eagerly) and with a lean
+mode (only the first sheet loaded on demand without formatting info) and
+reports parse time and peak memory usage per file. The lean mode showed no
+measurable gain on the fixtures, so parse() uses the default one.
+
+Usage: python benchmarks/sbrf_xls_parsing.py [ITERATIONS]
+"""
+
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+import xlrd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pydeposits import sbrf
+from pydeposits.util import Error
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "tests")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    for path in sorted(glob.glob(os.path.join(DATA_PATH, "sberbank_*.xls"))):
+        with open(path, "rb") as xls_file:
+            xls_contents = xls_file.read()
+
+        source = sbrf._MetalRates() if "metal" in os.path.basename(path) else sbrf._CurrencyRates()
+        print("{} ({:.1f} KB):".format(os.path.basename(path), len(xls_contents) / 1024))
+
+        for name, parse in (
+            ("default", _parse_default),
+            ("lean", _parse_lean),
+        ):
+            parse_time = _measure_time(parse, source, xls_contents, iterations)
+            peak_memory = _measure_memory(parse, source, xls_contents)
+            print("  {:8} {:8.1f} us per file, {:8.1f} KB peak memory.".format(
+                name + ":", parse_time / iterations * 10 ** 6, peak_memory / 1024))
+
+
+def _parse_default(source, xls_contents):
+    return source.parse(xls_contents)
+
+
+def _parse_lean(source, xls_contents):
+    workbook = xlrd.open_workbook(file_contents=xls_contents, on_demand=True, formatting_info=False)
+
+    try:
+        return source._parse(workbook.sheet_by_index(0))
+    finally:
+        workbook.release_resources()
+
+
+def _measure_time(parse, source, xls_contents, iterations):
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        _try_parse(parse, source, xls_contents)
+    return time.perf_counter() - start_time
+
+
+def _measure_memory(parse, source, xls_contents):
+    tracemalloc.start()
+    try:
+        _try_parse(parse, source, xls_contents)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _try_parse(parse, source, xls_contents):
+    # The fixture may not match the current parser: its workbook loading is still worth measuring
+    try:
+        return parse(source, xls_contents)
+    except Error:
+        pass
+
+
+if __name__ == "__main__":
+    main()
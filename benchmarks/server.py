@@ -0,0 +1,98 @@
+"""Measures latency and throughput of the HTTP JSON API server.
+
+Starts the server over a synthetic rate archive and a synthetic deposit list
+and queries each endpoint from a number of local keep-alive clients.
+
+Usage: python benchmarks/server.py [REQUESTS] [CLIENTS] [DEPOSITS]
+"""
+
+import datetime
+import http.client
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pydeposits import server
+from pydeposits.deposits import Holding
+from pydeposits.rate_archive import RateArchive
+
+from synthetic import generate_deposits, generate_rates
+
+CURRENCIES = ("USD", "EUR", "AUR_SBRF", "RUR")
+START_DATE = datetime.date(2013, 1, 1)
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    deposits = [Holding(**deposit) for deposit in generate_deposits(
+        int(sys.argv[3]) if len(sys.argv) > 3 else 20, CURRENCIES, START_DATE, 3 * 365)]
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        RateArchive.set_db_dir(db_dir)
+        RateArchive.enable_offline_mode(True)
+        generate_rates(RateArchive(), CURRENCIES, START_DATE, 4 * 365)
+
+        api_server = server.make_server(deposits, "127.0.0.1", 0)
+        thread = threading.Thread(target=api_server.serve_forever)
+        thread.start()
+
+        try:
+            print("{} deposits, {} requests per endpoint, {} clients.".format(len(deposits), requests, clients))
+
+            for path in (
+                "/statement?all=1",
+                "/expiring?days=30",
+                "/rates?currency=USD&date=01.06.2016",
+            ):
+                _benchmark(api_server.server_port, path, requests, clients)
+        finally:
+            api_server.shutdown()
+            api_server.server_close()
+            thread.join()
+
+
+def _benchmark(port, path, requests, clients):
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        client_latencies = []
+
+        for _ in range(requests // clients):
+            start_time = time.perf_counter()
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            client_latencies.append(time.perf_counter() - start_time)
+
+            if response.status != 200:
+                raise Exception("{} request has failed with {} status code.".format(path, response.status))
+
+        connection.close()
+
+        with lock:
+            latencies.extend(client_latencies)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total_time = time.perf_counter() - start_time
+
+    latencies.sort()
+    print("{:40} {:7.0f} req/sec, latency: {:6.2f} ms p50, {:6.2f} ms p95, {:6.2f} ms p99.".format(
+        path, len(latencies) / total_time, *(
+            latencies[int(len(latencies) * percentile)] * 1000 for percentile in (0.5, 0.95, 0.99))))
+
+
+if __name__ == "__main__":
+    main()
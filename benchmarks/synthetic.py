@@ -0,0 +1,50 @@
+"""Synthetic rate archive and deposits for the benchmarks."""
+
+import datetime
+import random
+
+from decimal import Decimal
+
+from pydeposits import constants
+
+
+def generate_rates(archive, currencies, start_date, days):
+    """Fills the rate archive with random rates for the specified period."""
+
+    rand = random.Random(0)
+
+    archive._RateArchive__add({
+        start_date + datetime.timedelta(day): {
+            currency: (Decimal(rand.randrange(5000, 8000)).scaleb(-2), Decimal(rand.randrange(5000, 8000)).scaleb(-2))
+            for currency in currencies if currency != constants.LOCAL_CURRENCY
+        } for day in range(days)
+    })
+
+
+def generate_deposits(number, currencies, start_date, days):
+    """
+    Generates deposits (as they're specified by the user) opened during the
+    specified period.
+    """
+
+    rand = random.Random(1)
+    deposits = []
+
+    for deposit_id in range(number):
+        open_date = start_date + datetime.timedelta(rand.randrange(days))
+        deposit = {
+            "bank": "Bank {}".format(deposit_id),
+            "open_date": open_date,
+            "close_date": open_date + datetime.timedelta(rand.randrange(90, 2 * 365)),
+            "currency": rand.choice(currencies),
+            "source_currency": constants.LOCAL_CURRENCY,
+            "amount": Decimal(rand.randrange(1000, 100000)),
+            "interest": Decimal(rand.randrange(100, 1000)).scaleb(-2),
+        }
+
+        if rand.random() < 0.5:
+            deposit["capitalization"] = Decimal(1)
+
+        deposits.append(deposit)
+
+    return deposits
@@ -0,0 +1,62 @@
+"""Compares the Decimal and the vectorized valuation engines.
+
+Generates a random portfolio and calculates the holdings' info with
+statements._calculate_holding_info() and with vectorized.calculate_holding_info().
+
+Usage: python benchmarks/vectorized_valuation.py [HOLDINGS]
+"""
+
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "tests"))
+
+from pydeposits import constants, statements, vectorized
+from helpers import generate_holding, generate_rates
+
+CURRENCIES = (constants.LOCAL_CURRENCY, "USD", "EUR")
+
+
+def main():
+    holding_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    if not vectorized.is_available():
+        sys.exit("NumPy is not installed.")
+
+    rand = random.Random(0)
+    holdings = []
+    rates = {}
+
+    for _ in range(holding_count):
+        holding = generate_holding(rand, CURRENCIES, completions=False)
+        today = holding.open_date + datetime.timedelta(rand.randrange(4 * 365))
+        holdings.append((holding, today))
+
+        for date in (holding.open_date, today):
+            rates.setdefault((holding.currency, date), generate_rates(rand, holding.currency))
+
+    print("{} holdings:".format(holding_count))
+
+    for name, calculate in (
+        ("decimal", _calculate_decimal),
+        ("vectorized", vectorized.calculate_holding_info),
+    ):
+        batch = [(statements.HoldingInfo(holding), today) for holding, today in holdings]
+        context = statements.ValuationContext(rates)
+
+        start_time = time.perf_counter()
+        calculate(batch, context)
+        print("  {:>10}: {:8.1f} ms".format(name, (time.perf_counter() - start_time) * 1000))
+
+
+def _calculate_decimal(infos, context):
+    for info, today in infos:
+        statements._calculate_holding_info(info, today, context)
+
+
+if __name__ == "__main__":
+    main()
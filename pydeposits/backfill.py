@@ -0,0 +1,288 @@
+"""Downloads rate info for many dates concurrently."""
+
+import contextlib
+import logging
+import multiprocessing
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from pydeposits import network
+
+log = logging.getLogger(__name__)
+
+
+BATCH_SIZE = 30
+"""Default number of days per source in a batch of results."""
+
+PIPELINE_QUEUE_SIZE = 16
+"""
+Maximum number of downloaded responses that wait for parsing or storing
+(download workers are blocked when the queue is full).
+"""
+
+
+def download(jobs, max_workers, batch_size=BATCH_SIZE, deadline=None):
+    """Downloads rates for a list of (source, dates, bulk) jobs.
+
+    Each source is processed by its own pool of at most max_workers threads.
+    If bulk is True, all the dates are requested from the source at once via
+    its get_rates_for_period() falling back to per-day downloads on error.
+
+    If the source supports fetch_for_date(), per-day downloads are pipelined:
+    the download workers only fetch the data and return (function, args) parse
+    jobs that are executed by a pool of worker processes, while storing of
+    the results is left to the consumer. fetch_for_date() may also return
+    already parsed rates as a dict.
+
+    Results are yielded as they come in (source name, rates, errors) batches
+    of at most batch_size days, where rates is a {date: {currency: rates}}
+    dict for successfully downloaded dates (including the ones for which the
+    source has no data) and errors is a list of (source name, date, error)
+    tuples for the failed ones (which are left to the consumer to report). A
+    failure for one date doesn't affect the others.
+
+    If deadline (as returned by time.time()) is specified, the download stops
+    when it's reached without waiting for the pending dates that are just
+    omitted from the results. The dates that fail after the deadline (network
+    requests fail immediately then) are omitted as well instead of being
+    reported as errors.
+    """
+
+    batches = {}
+    postponed = 0
+    progress = _Progress(sum(len(dates) for source, dates, bulk in jobs))
+
+    stopped = threading.Event()
+    pipeline_slots = threading.BoundedSemaphore(PIPELINE_QUEUE_SIZE)
+
+    with contextlib.ExitStack() as stack:
+        futures = {}
+        parse_pool = None
+
+        def submit_days(executor, source, dates):
+            for date in dates:
+                if hasattr(source, "fetch_for_date"):
+                    future = executor.submit(_fetch, source, date, pipeline_slots, stopped)
+                    futures[future] = (_FETCH, executor, source, [date])
+                else:
+                    future = executor.submit(source.get_rates_for_date, date)
+                    futures[future] = (_DOWNLOAD, executor, source, [date])
+
+        for source, dates, bulk in jobs:
+            if not dates:
+                continue
+
+            executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(dates))))
+            stack.callback(_shutdown, executor, stopped)
+            if bulk:
+                futures[executor.submit(source.get_rates_for_period, dates)] = (_BULK, executor, source, dates)
+            else:
+                submit_days(executor, source, dates)
+
+            batches[source.NAME] = ({}, [])
+
+        try:
+            while futures:
+                timeout = None if deadline is None else max(0, deadline - time.time())
+                done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                expired = deadline is not None and time.time() >= deadline
+
+                for future in done:
+                    stage, executor, source, dates = futures.pop(future)
+                    rates, errors = batches[source.NAME]
+
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        if stage == _PARSE:
+                            pipeline_slots.release()
+
+                        if expired:
+                            postponed += len(dates)
+                            continue
+                        elif stage == _BULK:
+                            log.warning("%s Falling back to per-day downloads...", e)
+                            submit_days(executor, source, dates)
+                            continue
+
+                        log.debug("%s", e)
+                        errors.extend((source.NAME, date, e) for date in dates)
+                    else:
+                        if stage == _FETCH:
+                            progress.fetched()
+
+                            if isinstance(result, tuple):
+                                if parse_pool is None:
+                                    # Forking while the download threads are running may leave a lock (of logging
+                                    # or urllib3, for example) held forever in the child, so the workers are spawned
+                                    parse_pool = stack.enter_context(
+                                        ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn")))
+
+                                function, args = result
+                                futures[parse_pool.submit(function, *args)] = (_PARSE, executor, source, dates)
+                                continue
+
+                            pipeline_slots.release()
+                        elif stage == _PARSE:
+                            progress.parsed()
+                            pipeline_slots.release()
+
+                        if stage == _BULK:
+                            result = {date: result.get(date) or {} for date in dates}
+                        else:
+                            result = {dates[0]: result or {}}
+
+                        for date, day_rates in result.items():
+                            rates[date] = day_rates
+
+                            if len(rates) + len(errors) >= batch_size:
+                                with progress.storing(len(rates) + len(errors)):
+                                    yield source.NAME, rates, errors
+                                rates, errors = batches[source.NAME] = ({}, [])
+
+                    progress.add(len(dates))
+
+                    if len(rates) + len(errors) >= batch_size:
+                        batches[source.NAME] = ({}, [])
+                        with progress.storing(len(rates) + len(errors)):
+                            yield source.NAME, rates, errors
+
+                if expired:
+                    postponed += sum(len(dates) for stage, executor, source, dates in futures.values())
+                    _stop(futures, stopped)
+                    break
+        except BaseException:
+            # Don't wait for the pending downloads if we are interrupted
+            _stop(futures, stopped)
+            raise
+
+    if postponed:
+        log.warning("Rate update time limit is exceeded. %s days are postponed.", postponed)
+
+    for source_name, (rates, errors) in batches.items():
+        if rates or errors:
+            with progress.storing(len(rates) + len(errors)):
+                yield source_name, rates, errors
+
+    progress.finish()
+
+
+_BULK = "bulk"
+"""Download of a whole period."""
+
+_DOWNLOAD = "download"
+"""Download and parsing of a single day."""
+
+_FETCH = "fetch"
+"""Pipeline stage: download of a single day."""
+
+_PARSE = "parse"
+"""Pipeline stage: parsing of a single day."""
+
+
+def _stop(futures, stopped):
+    """Cancels the pending futures and stops the download."""
+
+    stopped.set()
+    for future in futures:
+        future.cancel()
+
+
+def _shutdown(executor, stopped):
+    """Shuts down the executor without waiting for the running tasks if the download has been stopped."""
+
+    executor.shutdown(wait=not stopped.is_set(), cancel_futures=True)
+
+
+def _fetch(source, date, pipeline_slots, stopped):
+    """Fetches data for a day after waiting for a free slot in the pipeline."""
+
+    while not pipeline_slots.acquire(timeout=0.1):
+        if stopped.is_set():
+            raise Exception("The download has been cancelled.")
+
+    try:
+        result = source.fetch_for_date(date)
+    except BaseException:
+        pipeline_slots.release()
+        raise
+
+    return result
+
+
+class _Progress:
+    """Reports download progress and throughput of the download stages."""
+
+    __report_interval = 5
+    """Minimal interval between progress reports (in seconds)."""
+
+    def __init__(self, total):
+        self.__total = total
+        self.__done = 0
+        self.__fetched = 0
+        self.__parsed = 0
+        self.__stored = 0
+        self.__storing_time = 0.0
+        self.__start_time = time.time()
+        self.__last_report_time = self.__start_time
+        self.__start_bytes = network.get_downloaded_bytes()
+
+    def add(self, days=1):
+        """Registers processed days."""
+
+        self.__done += days
+
+        if time.time() - self.__last_report_time >= self.__report_interval:
+            self.__report()
+
+    def fetched(self):
+        """Registers a day fetched by the pipeline."""
+
+        self.__fetched += 1
+
+    def parsed(self):
+        """Registers a day parsed by the pipeline."""
+
+        self.__parsed += 1
+
+    @contextlib.contextmanager
+    def storing(self, days):
+        """Measures time spent by the consumer on storing of a batch of results."""
+
+        start_time = time.time()
+
+        try:
+            yield
+        finally:
+            self.__stored += days
+            self.__storing_time += time.time() - start_time
+
+    def finish(self):
+        """Reports the final statistics."""
+
+        if not self.__done:
+            return
+
+        self.__report(log.debug)
+
+        elapsed = self.__get_elapsed()
+        if self.__fetched:
+            log.debug("Download stage: %.1f days/sec. Parse stage: %.1f days/sec.",
+                      self.__fetched / elapsed, self.__parsed / elapsed)
+
+        if self.__stored:
+            log.debug("Store stage: %.1f days/sec (%.1f seconds spent).",
+                      self.__stored / max(self.__storing_time, 0.001), self.__storing_time)
+
+    def __get_elapsed(self):
+        return max(time.time() - self.__start_time, 0.001)
+
+    def __report(self, logger=log.info):
+        self.__last_report_time = time.time()
+        elapsed = self.__get_elapsed()
+        downloaded = network.get_downloaded_bytes() - self.__start_bytes
+
+        logger("Processed %s of %s days (%.1f days/sec, %.1f KB/sec).",
+               self.__done, self.__total, self.__done / elapsed, downloaded / 1024 / elapsed)
@@ -0,0 +1,118 @@
+"""Content-addressed store of raw responses received from rate sources.
+
+Every response is compressed and saved once under its SHA-256 hash, while an
+index maps (source, day, url) to the hash. It allows to rebuild rate info
+offline when a parser changes.
+"""
+
+import collections
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+
+from pydeposits import util
+from pydeposits.util import Error
+
+log = logging.getLogger(__name__)
+
+
+Response = collections.namedtuple("Response", ("source", "date", "url", "path"))
+"""A stored response."""
+
+
+_store_dir = None
+"""Store directory (the store is disabled if it's None)."""
+
+_index = None
+"""Index database."""
+
+_lock = threading.Lock()
+"""Lock for the module's global state."""
+
+
+def set_dir(path):
+    """Sets the store directory enabling the store."""
+
+    global _store_dir, _index
+
+    with _lock:
+        if path == _store_dir:
+            return
+
+        try:
+            os.makedirs(path, exist_ok=True)
+
+            index = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+            index.execute("PRAGMA journal_mode = WAL")
+            index.execute("PRAGMA synchronous = NORMAL")
+            index.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    source TEXT NOT NULL,
+                    day INTEGER NOT NULL,
+                    url TEXT NOT NULL,
+                    hash TEXT NOT NULL,
+                    PRIMARY KEY (source, day, url)
+                ) WITHOUT ROWID
+            """)
+            index.commit()
+        except Exception as e:
+            raise Error("Unable to open response store '{}':", path).append(e)
+
+        if _index is not None:
+            _index.close()
+
+        _store_dir, _index = path, index
+
+
+def save(source, date, url, contents):
+    """Saves a raw response (does nothing if the store is disabled)."""
+
+    if _store_dir is None:
+        return
+
+    content_hash = hashlib.sha256(contents).hexdigest()
+    path = _get_path(_store_dir, content_hash)
+
+    try:
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            temp_path = "{}.{}.{}".format(path, os.getpid(), threading.get_ident())
+            with open(temp_path, "wb") as blob:
+                blob.write(zlib.compress(contents))
+            os.replace(temp_path, path)
+
+        with _lock:
+            _index.execute("INSERT OR REPLACE INTO responses (source, day, url, hash) VALUES (?, ?, ?, ?)",
+                           (source, util.get_day(date), url, content_hash))
+            _index.commit()
+    except Exception as e:
+        log.warning("Unable to save response from %s to the response store: %s.", url, e)
+
+
+def get_responses():
+    """Returns a list of all stored responses."""
+
+    if _store_dir is None:
+        return []
+
+    with _lock:
+        rows = _index.execute("SELECT source, day, url, hash FROM responses ORDER BY source, day, url").fetchall()
+
+    return [
+        Response(source, util.get_date(day), url, _get_path(_store_dir, content_hash))
+        for source, day, url, content_hash in rows]
+
+
+def load(path):
+    """Loads a stored response."""
+
+    with open(path, "rb") as blob:
+        return zlib.decompress(blob.read())
+
+
+def _get_path(store_dir, content_hash):
+    return os.path.join(store_dir, content_hash[:2], content_hash[2:])
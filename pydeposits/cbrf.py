@@ -1,61 +1,248 @@
 """Contains tools for getting rate info from The Central Bank of the Russian Federation."""
 
-import http.cookiejar
+import bisect
+import datetime
+import io
 import logging
-import urllib.request
-import xml.dom.minidom
+import urllib.parse
 
 from decimal import Decimal
+from xml.etree import ElementTree
 
+from pydeposits import blob_store
 from pydeposits import constants
+from pydeposits import network
 from pydeposits.util import Error
 
 log = logging.getLogger(__name__)
 
 
-def get_rates(dates):
-    """Returns CBRF's rates for a specified dates."""
+NAME = "CBRF"
+"""Rate source name."""
 
-    rates = {}
 
-    # www.cbr.ru sometimes requires cookies for some reason
-    cookies = http.cookiejar.CookieJar()
-    url_opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies))
+_DAILY_URL = "http://www.cbr.ru/scripts/XML_daily.asp?date_req={date}"
+"""URL of daily rates for all currencies."""
 
-    for date in dates:
-        try:
-            log.info("Getting CBRF's currency rates for %s...", date)
+_DYNAMIC_URL = "http://www.cbr.ru/scripts/XML_dynamic.asp?date_req1={start_date}&date_req2={end_date}&VAL_NM_RQ={currency_id}"
+"""URL of a currency's rates for a period."""
+
+_PERIOD_LOOKBEHIND = 14
+"""
+Number of days before a period for which we request rates to get the rates
+that are valid at the period start (CBRF doesn't set rates on weekends and
+holidays).
+"""
+
+
+def get_rates_for_date(date):
+    """Returns CBRF's rates for a specified date."""
 
-            url = "http://www.cbr.ru/scripts/XML_daily.asp?date_req=" \
-                    "{0:02d}/{1:02d}/{2}".format(date.day, date.month, date.year)
+    try:
+        log.info("Getting CBRF's currency rates for %s...", date)
+        date_rates = parse_daily_rates(_fetch(date, _DAILY_URL.format(date=_format_date(date))))
+    except Exception as e:
+        raise Error("Unable to get rate info from The Central Bank of the Russian Federation for {}:", date).append(e)
 
-            xml_contents = url_opener.open(url, timeout=constants.NETWORK_TIMEOUT).read()
-            dom = xml.dom.minidom.parseString(xml_contents)
+    return date_rates
 
-            date_rates = {}
 
-            for currency in dom.getElementsByTagName("Valute"):
-                for node in currency.getElementsByTagName("CharCode")[0].childNodes:
-                    if node.nodeType == node.TEXT_NODE:
-                        name = node.data
-                        break
-                else:
-                    raise Error("Unable to get currency name.")
+def get_rates_for_period(dates):
+    """Returns CBRF's rates for a specified dates.
 
-                for node in currency.getElementsByTagName("Value")[0].childNodes:
-                    if node.nodeType == node.TEXT_NODE:
-                        rate = node.data
-                        break
-                else:
-                    raise Error("Unable to get currency rate for {}.", name)
+    Downloads the whole period between the first and the last date using one
+    request per currency, so it's suitable for long periods. The currencies
+    are the ones that CBRF has rates for on the last date.
+    """
 
-                date_rates[name] = (Decimal(rate.replace(",", ".")),) * 2
+    start_date, end_date = min(dates), max(dates)
 
-            if not date_rates:
-                raise Error("Empty XML document gotten.")
+    try:
+        log.info("Getting CBRF's currency rates for %s - %s...", start_date, end_date)
 
-            rates[date] = date_rates
-        except Exception as e:
-            raise Error("Unable to get rate info from The Central Bank of the Russian Federation for {}:", date).append(e)
+        daily_xml = _fetch(end_date, _DAILY_URL.format(date=_format_date(end_date)))
+
+        dynamic_xmls = {}
+        for name, currency_id in get_currency_ids(daily_xml):
+            dynamic_xmls[currency_id] = _fetch(end_date, _DYNAMIC_URL.format(
+                start_date=_format_date(start_date - datetime.timedelta(_PERIOD_LOOKBEHIND)),
+                end_date=_format_date(end_date), currency_id=currency_id))
+
+        rates = parse_period_rates(dates, daily_xml, dynamic_xmls)
+    except Exception as e:
+        raise Error("Unable to get rate info from The Central Bank of the Russian Federation for {} - {}:",
+                    start_date, end_date).append(e)
 
     return rates
+
+
+def get_reparse_jobs(responses):
+    """
+    Returns a list of (function, args) jobs that parse the specified stored
+    responses (see blob_store) returning {date: {currency: rates}} dicts.
+    """
+
+    jobs = []
+    periods = {}
+    daily_paths = {}
+
+    for response in responses:
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(response.url).query)
+
+        if "XML_daily.asp" in response.url:
+            daily_paths[response.date] = response.path
+            jobs.append((_reparse_daily, (response.date, response.path)))
+        elif "XML_dynamic.asp" in response.url:
+            start_date, end_date = (
+                datetime.datetime.strptime(query[name][0], "%d/%m/%Y").date() for name in ("date_req1", "date_req2"))
+            periods.setdefault((start_date, end_date), {})[query["VAL_NM_RQ"][0]] = response.path
+
+    for (start_date, end_date), dynamic_paths in sorted(periods.items()):
+        if end_date not in daily_paths:
+            log.warning("Skipping stored CBRF rates for %s - %s: there is no currency list for them.",
+                        start_date, end_date)
+            continue
+
+        dates = []
+        date = start_date + datetime.timedelta(_PERIOD_LOOKBEHIND)
+        while date <= end_date:
+            dates.append(date)
+            date += datetime.timedelta(1)
+
+        # Per-day rates are more precise, so period jobs go first to be overwritten by them
+        jobs.insert(0, (_reparse_period, (dates, daily_paths[end_date], dynamic_paths)))
+
+    return jobs
+
+
+def parse_period_rates(dates, daily_xml, dynamic_xmls):
+    """
+    Parses responses gotten for a period: XML_daily.asp response for the
+    last date and XML_dynamic.asp responses in {currency ID: response} form.
+    """
+
+    rates = {date: {} for date in dates}
+
+    for name, currency_id in get_currency_ids(daily_xml):
+        try:
+            dynamic_xml = dynamic_xmls[currency_id]
+        except KeyError:
+            raise Error("There is no rates for {}.", name)
+
+        records = parse_dynamic_rates(dynamic_xml)
+        record_dates = [record_date for record_date, rate in records]
+
+        # A rate is valid since its date until the next rate is set
+        for date in dates:
+            record_id = bisect.bisect_right(record_dates, date) - 1
+            if record_id >= 0:
+                rates[date][name] = (records[record_id][1],) * 2
+
+    return rates
+
+
+def parse_daily_rates(xml_contents):
+    """Parses XML_daily.asp response."""
+
+    date_rates = {name: (Decimal(rate.replace(",", ".")),) * 2 for name, rate in iter_daily_rates(xml_contents)}
+    if not date_rates:
+        raise Error("Empty XML document gotten.")
+
+    return date_rates
+
+
+def iter_daily_rates(xml_contents):
+    """
+    Parses XML_daily.asp response incrementally yielding (currency name,
+    rate string) pairs as they are parsed.
+    """
+
+    name = rate = None
+
+    for event, element in ElementTree.iterparse(io.BytesIO(xml_contents), events=("end",)):
+        if element.tag == "CharCode":
+            if name is None:
+                name = element.text
+        elif element.tag == "Value":
+            if rate is None:
+                rate = element.text
+        elif element.tag == "Valute":
+            if name is None:
+                raise Error("Unable to get currency name.")
+
+            if rate is None:
+                raise Error("Unable to get currency rate for {}.", name)
+
+            yield name, rate
+
+            name = rate = None
+            element.clear()
+
+
+def get_currency_ids(xml_contents):
+    """Returns a list of (currency name, CBRF currency ID) pairs from XML_daily.asp response."""
+
+    currency_ids = []
+
+    for event, element in ElementTree.iterparse(io.BytesIO(xml_contents), events=("end",)):
+        if element.tag == "Valute":
+            name = element.findtext("CharCode")
+            currency_id = element.get("ID")
+            if not name or not currency_id:
+                raise Error("Unable to get currency ID.")
+
+            currency_ids.append((name, currency_id))
+            element.clear()
+
+    if not currency_ids:
+        raise Error("Empty XML document gotten.")
+
+    return currency_ids
+
+
+def parse_dynamic_rates(xml_contents):
+    """Parses XML_dynamic.asp response into a list of (date, rate) tuples sorted by date."""
+
+    records = []
+
+    for event, element in ElementTree.iterparse(io.BytesIO(xml_contents), events=("end",)):
+        if element.tag == "Record":
+            try:
+                date = datetime.datetime.strptime(element.get("Date", ""), constants.DATE_FORMAT).date()
+            except ValueError:
+                raise Error("Got an invalid record date: {}.", element.get("Date"))
+
+            rate = element.findtext("Value")
+            if not rate:
+                raise Error("Unable to get currency rate for {}.", date)
+
+            records.append((date, Decimal(rate.replace(",", "."))))
+            element.clear()
+
+    records.sort()
+
+    return records
+
+
+def _fetch(date, url):
+    """Fetches the specified URL saving the response to the response store."""
+
+    contents = network.fetch_url(url).content
+    blob_store.save(NAME, date, url, contents)
+
+    return contents
+
+
+def _format_date(date):
+    """Formats a date for CBRF's requests."""
+
+    return "{0:02d}/{1:02d}/{2}".format(date.day, date.month, date.year)
+
+
+def _reparse_daily(date, path):
+    return {date: parse_daily_rates(blob_store.load(path))}
+
+
+def _reparse_period(dates, daily_path, dynamic_paths):
+    return parse_period_rates(dates, blob_store.load(daily_path), {
+        currency_id: blob_store.load(path) for currency_id, path in dynamic_paths.items()})
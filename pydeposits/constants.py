@@ -12,5 +12,32 @@ LOCAL_CURRENCY = "RUR"
 NETWORK_TIMEOUT = 30
 """Network timeout in seconds."""
 
+HTTP_RETRIES = 3
+"""Number of retries for failed HTTP requests."""
+
+HTTP_RETRY_BACKOFF = 0.5
+"""Backoff factor for HTTP retries (the delays are 0.5, 1, 2, ... seconds)."""
+
+HTTP_HOST_CONNECTIONS = 8
+"""Maximum number of simultaneous HTTP connections per host."""
+
+DOWNLOAD_WORKERS = 8
+"""Default maximum number of concurrent downloads per rate source."""
+
+UPDATE_TIME_LIMIT = 60
+"""Default maximum total time (in seconds) for updating of rate info."""
+
+TODAYS_RATES_TTL = 15 * 60
+"""Default time (in seconds) during which downloaded today's rates are considered up to date."""
+
+RATES_REFRESH_INTERVAL = 15 * 60
+"""Interval (in seconds) between currency rate updates in the server mode."""
+
+SERVER_ADDRESS = "127.0.0.1"
+"""Default address to listen on in the server mode."""
+
+SERVER_PORT = 8460
+"""Default port to listen on in the server mode."""
+
 DATE_FORMAT = "%d.%m.%Y"
 """Default date format."""
@@ -2,6 +2,7 @@
 
 """Provides functions for parsing deposit info specified by the user."""
 
+import collections
 import datetime
 import imp
 import pprint
@@ -13,8 +14,17 @@ from pydeposits import constants
 from pydeposits.util import Error
 
 
+Holding = collections.namedtuple("Holding", (
+    "bank", "open_date", "currency", "amount", "close_date", "source_currency", "source_amount", "interest",
+    "capitalization", "completions", "closed"), defaults=(None, None, None, None, None, None, False))
+"""A deposit. Optional fields that aren't specified are None, completions is a tuple of Completion."""
+
+Completion = collections.namedtuple("Completion", ("date", "amount"))
+"""A deposit completion."""
+
+
 def get():
-    """Returns a list of deposits specified by the user."""
+    """Returns a list of deposits (Holding) specified by the user."""
 
     info_path = os.path.join(os.path.expanduser("~/." + constants.APP_UNIX_NAME), "deposits.py")
     if not os.path.exists(info_path):
@@ -102,7 +112,17 @@ def get():
     if not deposits:
         raise Error("You specified an empty deposit list.")
 
-    return deposits
+    return [_get_holding(deposit) for deposit in deposits]
+
+
+def _get_holding(deposit):
+    """Converts a validated deposit info to a Holding."""
+
+    if "completions" in deposit:
+        deposit = dict(deposit, completions=tuple(
+            Completion(completion["date"], completion["amount"]) for completion in deposit["completions"]))
+
+    return Holding(**deposit)
 
 
 _NO_DEPOSIT_INFO_ERROR_MESSAGE = """\
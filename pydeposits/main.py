@@ -9,9 +9,11 @@ import traceback
 import pcli.log
 
 import pydeposits.deposits
+import pydeposits.server
 import pydeposits.statements
 
 from pydeposits import constants
+from pydeposits import network
 from pydeposits.rate_archive import RateArchive
 from pydeposits.util import EE, Error
 
@@ -19,21 +21,36 @@ from pydeposits.util import EE, Error
 def main():
     """The application's main function."""
 
+    command = None
+    history_dates = None
+    output_format = "csv"
+    per_holding = False
+    server_address = constants.SERVER_ADDRESS
+    server_port = constants.SERVER_PORT
     show_all = False
+    use_numpy = False
+    background_update = False
     debug_mode = False
     offline_mode = False
     show_expiring = None
+    download_workers = None
+    todays_rates_ttl = None
+    update_time_limit = None
     today = datetime.date.today()
 
     try:
         # Parsing command line options -->
         try:
             cmd_options, cmd_args = getopt.gnu_getopt(sys.argv[1:],
-                "ade:hot:", [ "all", "debug-mode", "expiring=", "help", "offline-mode", "today=" ] )
+                "abde:f:hj:l:nopr:t:", [ "all", "background-update", "debug-mode", "expiring=", "format=", "help",
+                                         "jobs=", "numpy", "offline-mode", "per-holding", "rates-ttl=", "time-limit=",
+                                         "today=" ] )
 
             for option, value in cmd_options:
                 if option in ("-a", "--all"):
                     show_all = True
+                elif option in ("-b", "--background-update"):
+                    background_update = True
                 elif option in ("-d", "--debug-mode"):
                     debug_mode = True
                 elif option in ("-e", "--expiring"):
@@ -43,21 +60,63 @@ def main():
                             raise Exception("negative number")
                     except Exception:
                         raise Error("Invalid number of days ({}).", value)
+                elif option in ("-f", "--format"):
+                    if value not in ("csv", "json"):
+                        raise Error("Invalid output format ({}).", value)
+                    output_format = value
+                elif option in ("-j", "--jobs"):
+                    try:
+                        download_workers = int(value)
+                        if download_workers < 1:
+                            raise Exception("non-positive number")
+                    except Exception:
+                        raise Error("Invalid number of jobs ({}).", value)
+                elif option in ("-l", "--time-limit"):
+                    try:
+                        update_time_limit = int(value)
+                        if update_time_limit < 1:
+                            raise Exception("non-positive number")
+                    except Exception:
+                        raise Error("Invalid number of seconds ({}).", value)
                 elif option in ("-h", "--help"):
                     print (
-                        """pydeposits [OPTIONS]\n\n"""
+                        """pydeposits [OPTIONS] [COMMAND]\n\n"""
+                         """Commands:\n"""
+                         """ history FROM TO      print deposit statement history for the period in CSV or JSON format\n"""
+                         """ reparse              rebuild currency rates from the stored server responses (works offline)\n"""
+                         """ serve [[ADDR:]PORT]  serve statements and currency rates via HTTP JSON API (default is {4}:{5})\n\n"""
                          """Options:\n"""
                          """ -a, --all            show all deposits (not only that are not closed)\n"""
                          """ -t, --today DAY      behave like today is the day, specified by the argument in {0} format\n"""
                          """ -e, --expiring DAYS  print only deposits which will be expired in DAYS days (useful for running by cron)\n"""
+                         """ -f, --format FORMAT  history output format: csv or json (default is csv)\n"""
+                         """ -p, --per-holding    print history for each deposit instead of the totals\n"""
+                         """ -j, --jobs N         download currency rates using up to N concurrent connections per rate source (default is {1})\n"""
+                         """ -l, --time-limit SEC spend no more than SEC seconds on updating of currency rates (default is {3})\n"""
+                         """ -n, --numpy          calculate large statements using NumPy (faster, but may differ in rounding)\n"""
+                         """ -b, --background-update\n"""
+                         """                      update currency rates in background and show the statement using the local database\n"""
+                         """ -r, --rates-ttl MIN  do not download today's currency rates if they have been downloaded less than MIN minutes ago (default is {2})\n"""
                          """ -o, --offline-mode   offline mode (do not connect to the Internet for getting currency rates)\n"""
                          """ -d, --debug-mode     enable debug mode\n"""
                          """ -h, --help           show this help"""
-                         .format(constants.DATE_FORMAT)
+                         .format(constants.DATE_FORMAT, constants.DOWNLOAD_WORKERS, constants.TODAYS_RATES_TTL // 60,
+                                 constants.UPDATE_TIME_LIMIT, constants.SERVER_ADDRESS, constants.SERVER_PORT)
                     )
                     sys.exit(0)
+                elif option in ("-n", "--numpy"):
+                    use_numpy = True
                 elif option in ("-o", "--offline-mode"):
                     offline_mode = True
+                elif option in ("-p", "--per-holding"):
+                    per_holding = True
+                elif option in ("-r", "--rates-ttl"):
+                    try:
+                        todays_rates_ttl = int(value)
+                        if todays_rates_ttl < 0:
+                            raise Exception("negative number")
+                    except Exception:
+                        raise Error("Invalid number of minutes ({}).", value)
                 elif option in ("-t", "--today"):
                     try:
                         today = datetime.datetime.strptime(value, constants.DATE_FORMAT).date()
@@ -66,7 +125,34 @@ def main():
                 else:
                     raise Error("Logical error.")
             if len(cmd_args):
-                raise Error("'{}' is not recognized", cmd_args[0])
+                if cmd_args[0] == "reparse" and len(cmd_args) == 1:
+                    command = cmd_args[0]
+                elif cmd_args[0] == "history" and len(cmd_args) == 3:
+                    command = cmd_args[0]
+
+                    try:
+                        history_dates = [datetime.datetime.strptime(value, constants.DATE_FORMAT).date()
+                                         for value in cmd_args[1:]]
+                    except Exception:
+                        raise Error("Invalid history period ({} - {}).", *cmd_args[1:])
+
+                    if history_dates[0] > history_dates[1]:
+                        raise Error("Invalid history period ({} - {}).", *cmd_args[1:])
+                elif cmd_args[0] == "serve" and len(cmd_args) <= 2:
+                    command = cmd_args[0]
+
+                    if len(cmd_args) == 2:
+                        try:
+                            address, _, port = cmd_args[1].rpartition(":")
+                            server_port = int(port)
+                            if not 0 < server_port < 65536:
+                                raise Exception("invalid port")
+                            if address:
+                                server_address = address
+                        except Exception:
+                            raise Error("Invalid server address ({}).", cmd_args[1])
+                else:
+                    raise Error("'{}' is not recognized", cmd_args[0])
         except Exception as e:
             raise Error("Invalid arguments:").append(e)
         # Parsing command line options <--
@@ -76,6 +162,19 @@ def main():
         if debug_mode:
             RateArchive.set_db_dir(os.path.abspath("."))
         RateArchive.enable_offline_mode(offline_mode)
+        if download_workers is not None:
+            RateArchive.set_download_workers(download_workers)
+        if todays_rates_ttl is not None:
+            RateArchive.set_todays_rates_ttl(todays_rates_ttl * 60)
+        if update_time_limit is not None:
+            RateArchive.set_update_time_limit(update_time_limit)
+        RateArchive.enable_background_update(background_update)
+
+        if command == "reparse":
+            RateArchive.enable_offline_mode(True)
+            if RateArchive().reparse():
+                raise Error("Some of the stored responses have failed to be parsed.")
+            sys.exit(0)
 
         try:
             deposits = pydeposits.deposits.get()
@@ -83,10 +182,25 @@ def main():
             # To print exact error string without any modifications by EE().
             sys.exit(str(e))
 
-        if show_expiring is not None:
+        if command == "serve":
+            try:
+                pydeposits.server.serve(deposits, server_address, server_port)
+            except KeyboardInterrupt:
+                pass
+            sys.exit(0)
+
+        if command == "history":
+            pydeposits.statements.print_history(deposits, history_dates[0], history_dates[1], show_all,
+                                                per_holding, output_format)
+        elif show_expiring is not None:
             pydeposits.statements.print_expiring(deposits, today, show_expiring)
         else:
-            pydeposits.statements.print_account_statement(deposits, today, show_all)
+            pydeposits.statements.print_account_statement(deposits, today, show_all, use_numpy)
+
+        # The results of the background update will be used on the next run
+        RateArchive.wait_for_update()
+
+        network.log_stats()
     except Exception as e:
         if debug_mode:
             traceback.print_exc()
@@ -0,0 +1,150 @@
+"""Provides a shared keep-alive HTTP client for all rate sources."""
+
+import logging
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests import RequestException
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from pydeposits import constants
+
+log = logging.getLogger(__name__)
+
+
+_session = None
+"""Shared HTTP session."""
+
+_stats = {}
+"""Request statistics by host."""
+
+_deadline = None
+"""Time after which all requests fail immediately."""
+
+_lock = threading.Lock()
+"""Lock for the module's global state."""
+
+
+class DeadlineExceeded(RequestException):
+    """Raised for requests that are made after the deadline (see set_deadline())."""
+
+
+class HostStats:
+    """Request statistics for a host."""
+
+    __slots__ = ("requests", "failures", "total_time", "max_time", "bytes")
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.bytes = 0
+
+    def copy(self):
+        stats = HostStats()
+        for name in self.__slots__:
+            setattr(stats, name, getattr(self, name))
+        return stats
+
+
+def fetch_url(url, headers=None):
+    """Fetches the specified URL.
+
+    "304 Not Modified" responses to conditional requests are returned as is.
+    """
+
+    host = urllib.parse.urlsplit(url).netloc
+    start_time = time.time()
+    response = None
+
+    timeout = constants.NETWORK_TIMEOUT
+    if _deadline is not None:
+        timeout = min(timeout, _deadline - start_time)
+        if timeout <= 0:
+            raise DeadlineExceeded("Time limit for network requests is exceeded.")
+
+    try:
+        response = _get_session().get(url, headers=headers, timeout=timeout)
+        if response.status_code not in (requests.codes.ok, requests.codes.not_modified):
+            raise RequestException("Server returned an error: {} {}".format(response.status_code, response.reason),
+                                   response=response)
+    except Exception:
+        _account(host, start_time, response, failed=True)
+        raise
+    else:
+        _account(host, start_time, response)
+
+    return response
+
+
+def set_deadline(deadline):
+    """
+    Sets time (as returned by time.time()) after which all requests fail
+    immediately (None removes the limit).
+    """
+
+    global _deadline
+    _deadline = deadline
+
+
+def get_downloaded_bytes():
+    """Returns total number of bytes downloaded by the process."""
+
+    with _lock:
+        return sum(stats.bytes for stats in _stats.values())
+
+
+def get_stats():
+    """Returns a {host: HostStats} dict with request statistics."""
+
+    with _lock:
+        return {host: stats.copy() for host, stats in _stats.items()}
+
+
+def log_stats():
+    """Logs request statistics (in debug mode)."""
+
+    for host, stats in sorted(get_stats().items()):
+        log.debug("%s: %s requests (%s failed), %.1f KB, %.0f ms average latency, %.0f ms max latency.",
+                  host, stats.requests, stats.failures, stats.bytes / 1024,
+                  stats.total_time / stats.requests * 1000, stats.max_time * 1000)
+
+
+def _account(host, start_time, response, failed=False):
+    """Accounts a request in the statistics."""
+
+    elapsed = time.time() - start_time
+
+    with _lock:
+        stats = _stats.setdefault(host, HostStats())
+        stats.requests += 1
+        stats.failures += failed
+        stats.total_time += elapsed
+        stats.max_time = max(stats.max_time, elapsed)
+        if response is not None:
+            stats.bytes += len(response.content)
+
+
+def _get_session():
+    """Returns the shared HTTP session creating it on the first call."""
+
+    global _session
+
+    with _lock:
+        if _session is None:
+            # Retry on connection errors and temporary server errors. Requests supports gzip out of the box.
+            retry = Retry(total=constants.HTTP_RETRIES, backoff_factor=constants.HTTP_RETRY_BACKOFF,
+                          status_forcelist=(500, 502, 503, 504), allowed_methods=("GET",), raise_on_status=False)
+            adapter = HTTPAdapter(pool_maxsize=constants.HTTP_HOST_CONNECTIONS, pool_block=True, max_retries=retry)
+
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+
+            _session = session
+
+        return _session
@@ -1,14 +1,25 @@
 """Stores and returns info about current and past currency rates."""
 
 from decimal import Decimal
+import bisect
+import concurrent.futures
+import contextlib
 import datetime
 import errno
+import fcntl
+import itertools
 import logging
 import os
 import sqlite3
+import threading
+import time
+import types
 
+from pydeposits import backfill
+from pydeposits import blob_store
 from pydeposits import cbrf
 from pydeposits import constants
+from pydeposits import network
 from pydeposits import sbrf
 from pydeposits import util
 from pydeposits.util import Error
@@ -26,29 +37,140 @@ info for this days.
 ARCHIVE_PERIOD_AT_FIRST_START = 3 * 365
 """Number of days for which rate data will be downloaded at first start."""
 
+BULK_DOWNLOAD_MIN_DAYS = 30
+"""
+Minimum number of days to download from a source that supports period
+requests for which they are used instead of per-day requests.
+"""
+
+SCHEMA_VERSION = 6
+"""Current version of the database schema."""
+
+FETCH_ATTEMPTS = 3
+"""
+Number of attempts to get rates for a day from a source after which the day
+is retried with an exponential backoff (see FAILED_DAY_RETRY_INTERVAL).
+"""
+
+FAILED_DAY_RETRY_INTERVAL = 1
+"""
+Interval (in days) before the first retry of a day that has failed
+FETCH_ATTEMPTS times. It's doubled after each subsequent failure up to
+FAILED_DAY_MAX_RETRY_INTERVAL.
+"""
+
+FAILED_DAY_MAX_RETRY_INTERVAL = 64
+"""Maximum interval (in days) between retries of a failed day."""
+
+FETCH_STATUS_FETCHED = "fetched"
+"""Fetch log status: rates have been fetched."""
+
+FETCH_STATUS_EMPTY = "empty"
+"""Fetch log status: the source has no data for the day."""
+
+FETCH_STATUS_FAILED = "failed"
+"""Fetch log status: the last attempt to get rates has failed."""
+
+EMPTY_DAY_FINALIZATION_DAYS = 3
+"""
+Number of days after which a day without data is considered final: sources
+may publish data with a delay, so until then such days are rechecked (at
+most once a day).
+"""
+
+UPDATE_LOCK_POLL_INTERVAL = 0.1
+"""Interval (in seconds) between attempts to acquire the update lock held by another process."""
+
+RATE_SCALE = 6
+"""Rates are stored in the database as integers multiplied by 10 ** RATE_SCALE."""
+
+
+_SOURCES = (cbrf,) + sbrf.SOURCES
+"""Rate sources."""
+
 
 class RateArchive:
     """Object that provides an ability to get currency rates info.
 
-    Attention! Class and its objects are not thread-safe.
+    The archive may be used from many threads: each thread gets its own
+    database connection, while today's rates and the rate indexes are
+    published as snapshots that are never modified after publishing. The
+    configuration methods must be called before the first object creation.
     """
 
+    _lock = threading.RLock()
+    """Lock for opening of the database and loading of today's rates."""
+
+    _update_lock = threading.Lock()
+    """Lock that allows only one thread to update rate info."""
+
     _db_dir = None
     """Database directory."""
 
     _db = None
     """Database for storing rate data."""
 
+    _db_path = None
+    """Path to the database."""
+
+    _lock_path = None
+    """Path to the lock file that allows only one process to update the database."""
+
+    _db_thread = None
+    """ID of the thread that owns the _db connection."""
+
+    _local = threading.local()
+    """Thread-local database connections of the other threads."""
+
+    _download_workers = constants.DOWNLOAD_WORKERS
+    """Maximum number of concurrent downloads per rate source."""
+
     _offline_mode = False
     """
     True if we must not connect to the Internet for getting currency rates and
     should use only the local database.
     """
 
+    _background_update = False
+    """
+    True if rate info must be updated in background while the local database
+    is used to serve the requests.
+    """
+
+    _update_thread = None
+    """Background update thread."""
+
+    _update_time_limit = constants.UPDATE_TIME_LIMIT
+    """Maximum total time (in seconds) for updating of rate info."""
+
     _todays_rates = None
-    """Rates for today."""
+    """Rates for today (a read-only snapshot)."""
+
+    _todays_rates_time = None
+    """Time when the oldest of today's rates have been downloaded."""
+
+    _todays_rates_ttl = constants.TODAYS_RATES_TTL
+    """Time (in seconds) during which today's rates are considered up to date."""
+
+    _todays_rates_updated = None
+    """
+    True if today's rates have been loaded after an update that has got all
+    of them, False if the update has failed to get some of them or None if
+    they have been loaded without an update.
+    """
+
+    _indexes = {}
+    """
+    In-memory rate indexes (lazily loaded from the database) by currency. The
+    dict is replaced by an empty one when the database is changed.
+    """
 
     def __init__(self):
+        if RateArchive._db is None or RateArchive._todays_rates is None:
+            with self._lock:
+                self.__init()
+
+    def __init(self):
         if RateArchive._db is None:
             if self._db_dir is None:
                 self._db_dir = os.path.expanduser("~/." + constants.APP_UNIX_NAME)
@@ -61,27 +183,58 @@ class RateArchive:
                     if e.errno != errno.EEXIST:
                         raise
 
-                db = sqlite3.connect(db_path)
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS rates (
-                        day INTEGER,
-                        currency TEXT,
-                        sell_rate TEXT,
-                        buy_rate TEXT
-                    )
-                """)
-                db.execute("CREATE INDEX IF NOT EXISTS rate_index ON rates (day, currency)")
-                db.commit()
+                lock_path = os.path.join(self._db_dir, "rates.lock")
+
+                db = _connect(db_path)
+                _init_db(db, lock_path)
+
+                sbrf.set_cache_dir(self._db_dir)
+                blob_store.set_dir(os.path.join(self._db_dir, "responses"))
 
                 RateArchive._db = db
+                RateArchive._db_path = db_path
+                RateArchive._lock_path = lock_path
+                RateArchive._db_thread = threading.get_ident()
             except Exception as e:
                 raise Error("Unable to open database '{}':", db_path).append(e)
 
-        if RateArchive._todays_rates is None and not self._offline_mode:
-            try:
-                RateArchive._todays_rates = self.__update()
-            except Exception as e:
-                raise Error("Unable to update rate info.").append(e)
+        if RateArchive._todays_rates is None:
+            updated = None
+
+            if not self._offline_mode and RateArchive._update_thread is None:
+                deadline = time.time() + self._update_time_limit
+
+                if self._background_update:
+                    RateArchive._update_thread = threading.Thread(
+                        target=self.__update_in_background, args=(deadline,), name="Rate update", daemon=True)
+                    RateArchive._update_thread.start()
+                else:
+                    try:
+                        updated = self.__update(deadline)
+                    except Exception as e:
+                        raise Error("Unable to update rate info.").append(e)
+
+            todays_rates, RateArchive._todays_rates_time = self.__load_todays_rates()
+            RateArchive._todays_rates_updated = updated
+            RateArchive._todays_rates = types.MappingProxyType(todays_rates)
+
+    @classmethod
+    def set_download_workers(cls, number):
+        """Sets maximum number of concurrent downloads per rate source."""
+
+        cls._download_workers = number
+
+    @classmethod
+    def set_todays_rates_ttl(cls, seconds):
+        """Sets time during which downloaded today's rates are considered up to date."""
+
+        cls._todays_rates_ttl = seconds
+
+    @classmethod
+    def set_update_time_limit(cls, seconds):
+        """Sets maximum total time for updating of rate info."""
+
+        cls._update_time_limit = seconds
 
     @classmethod
     def enable_offline_mode(cls, value):
@@ -89,93 +242,693 @@ class RateArchive:
 
         cls._offline_mode = value
 
+    @classmethod
+    def enable_background_update(cls, value):
+        """
+        Enables/disables the background update mode in which requests are
+        served from the local database immediately, while the update runs in
+        background and its results are saved for the next run.
+        """
+
+        cls._background_update = value
+
+    @classmethod
+    def wait_for_update(cls):
+        """Waits for the background update (if any) to complete."""
+
+        if cls._update_thread is None:
+            return
+
+        if cls._update_thread.is_alive():
+            log.info("Waiting for the rate info update to complete...")
+
+        cls._update_thread.join()
+
+    def update(self):
+        """
+        Updates rate info and publishes the new today's rates (for
+        long-running processes). Picks up the changes made by other processes
+        (the download is skipped in the offline mode).
+        """
+
+        updated = None
+
+        if not self._offline_mode:
+            try:
+                updated = self.__update(time.time() + self._update_time_limit)
+            except Exception as e:
+                raise Error("Unable to update rate info.").append(e)
+
+        with self._lock:
+            # The database may have been changed by another process
+            db = self.__get_db()
+            data_version = (db, db.execute("PRAGMA data_version").fetchone()[0])
+            if data_version != getattr(self._local, "data_version", None):
+                self._local.data_version = data_version
+                RateArchive._indexes = {}
+
+            todays_rates, RateArchive._todays_rates_time = self.__load_todays_rates()
+            RateArchive._todays_rates_updated = updated
+            RateArchive._todays_rates = types.MappingProxyType(todays_rates)
+
     def get_approx(self, currency, date):
         """
         Returns currency rates for the specified date or for the nearest date
         if there is no data for the specified date.
         """
 
+        indexes = self._indexes
+        if currency not in indexes and currency != constants.LOCAL_CURRENCY:
+            self.__load_indexes(indexes, (currency,))
+
+        return self.__get_approx(indexes, self._todays_rates, currency, date)
+
+    def get_approx_many(self, requests):
+        """
+        Returns a {(currency, date): rates} dict with rates for each of the
+        specified (currency, date) pairs (see get_approx()).
+        """
+
+        indexes, todays_rates = self._indexes, self._todays_rates
+        self.__load_indexes(indexes, (currency for currency, date in requests if currency != constants.LOCAL_CURRENCY))
+        return {(currency, date): self.__get_approx(indexes, todays_rates, currency, date)
+                for currency, date in requests}
+
+    def get_stale_rates_time(self):
+        """
+        Returns time as of which today's rates are known if they are stale
+        (the update has failed to get them or, if there was no update, they
+        haven't been updated during the TTL) or None otherwise.
+        """
+
+        if self._todays_rates_time is None or self._todays_rates_updated:
+            return None
+
+        if self._todays_rates_updated is None and time.time() - self._todays_rates_time < self._todays_rates_ttl:
+            return None
+
+        return datetime.datetime.fromtimestamp(self._todays_rates_time)
+
+    def reparse(self, workers=None):
+        """Rebuilds rate info from the stored raw responses without any network access.
+
+        The responses are parsed by a pool of worker processes. Returns a
+        number of the responses that failed to be parsed.
+        """
+
+        responses = blob_store.get_responses()
+
+        jobs = []
+        for source in _SOURCES:
+            jobs.extend(source.get_reparse_jobs([response for response in responses if response.source == source.NAME]))
+
+        log.info("Reparsing %s stored responses...", len(responses))
+
+        rates = {}
+        failed = 0
+        today = datetime.date.today()
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            # Results are processed in the jobs' order, so the later ones take precedence
+            for future in [executor.submit(function, *args) for function, args in jobs]:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    log.error("%s", e)
+                    failed += 1
+                    continue
+
+                for date, day_rates in result.items():
+                    if date != today:
+                        rates.setdefault(date, {}).update(day_rates)
+
+        if rates:
+            self.__add(rates)
+
+        return failed
+
+    @classmethod
+    def set_db_dir(cls, path):
+        """Sets custom database directory."""
+
+        cls._db_dir = path
+
+    def __add(self, rates, fetch_log=()):
+        """Saves new rate info and fetch log records in a single transaction.
+
+        fetch_log is a list of (source name, date, status) tuples.
+        """
+
+        today = util.get_day(datetime.date.today())
+
+        data = []
+
+        for date, currencies in rates.items():
+            for currency, rates in currencies.items():
+                data.append((
+                    currency, util.get_day(date),
+                    _to_fixed_point(rates[0]), _to_fixed_point(rates[1])
+                ))
+
+        db = self.__get_db()
+
+        db.executemany("""
+            INSERT OR REPLACE INTO rates (currency, day, sell_rate, buy_rate) VALUES (?, ?, ?, ?)
+        """, data)
+
+        db.executemany("""
+            INSERT INTO fetch_log (source, day, status, attempts, checked) VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT (source, day) DO UPDATE SET
+                attempts = CASE WHEN status = excluded.status THEN attempts + 1 ELSE 1 END,
+                status = excluded.status,
+                checked = excluded.checked
+        """, [(source, util.get_day(date), status, today) for source, date, status in fetch_log])
+
+        db.commit()
+
+        RateArchive._indexes = {}
+
+    def __add_todays_rates(self, source_rates, failed_sources=()):
+        """Saves today's rates to the intraday cache.
+
+        source_rates is a {source name: {currency: rates}} dict. The failed
+        attempts to get today's rates from failed_sources are saved as well,
+        so the sources aren't requested again during the TTL.
+        """
+
+        db = self.__get_db()
+        today = util.get_day(datetime.date.today())
+        now = int(time.time())
+
+        db.executemany("INSERT OR REPLACE INTO intraday_failures (source, day, checked) VALUES (?, ?, ?)",
+                       [(source_name, today, now) for source_name in failed_sources])
+
+        for source_name, rates in source_rates.items():
+            db.execute("DELETE FROM intraday_failures WHERE source = ?", (source_name,))
+            db.execute("DELETE FROM intraday_rates WHERE source = ?", (source_name,))
+            db.executemany("""
+                INSERT INTO intraday_rates (source, currency, sell_rate, buy_rate) VALUES (?, ?, ?, ?)
+            """, [
+                (source_name, currency, _to_fixed_point(rates[0]), _to_fixed_point(rates[1]))
+                for currency, rates in rates.items()
+            ])
+            db.execute("INSERT OR REPLACE INTO intraday_log (source, day, updated) VALUES (?, ?, ?)",
+                       (source_name, today, now))
+
+        db.commit()
+
+    def __get_db(self):
+        """Returns the database connection for the current thread."""
+
+        if threading.get_ident() == self._db_thread:
+            return self._db
+
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = _connect(self._db_path)
+
+        return db
+
+    def __close_thread_db(self):
+        """Closes the database connection of the current background thread."""
+
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            del self._local.db
+
+    def __get_approx(self, indexes, todays_rates, currency, date):
+        """Implements get_approx() using the specified snapshots of the indexes and today's rates."""
+
         if currency == constants.LOCAL_CURRENCY:
             return ( Decimal(1), Decimal(1) )
 
         day = util.get_day(date)
         today = util.get_day(datetime.date.today())
 
-        rates = [ rate for rate in self._db.execute("""
+        nearest = indexes[currency].find_nearest(day)
+
+        if (
+            todays_rates is not None and
+            currency in todays_rates and
+            day - MIN_RATE_ACCURACY <= today <= day + MIN_RATE_ACCURACY and
+            (nearest is None or abs(day - today) < abs(day - nearest[0]))
+        ):
+            nearest = (today, todays_rates[currency])
+
+        if nearest is None:
+            return None
+        else:
+            return nearest[1]
+
+    def __load_indexes(self, indexes, currencies):
+        """
+        Loads in-memory rate indexes for the specified currencies to the
+        indexes dict using a single query.
+        """
+
+        currencies = sorted(set(currencies).difference(indexes))
+        if not currencies:
+            return
+
+        rows = self.__get_db().execute("""
             SELECT
+                currency,
                 day,
                 sell_rate,
                 buy_rate
             FROM
                 rates
             WHERE
-                currency = ? AND ? <= day AND day <= ?
-        """, (currency, day - MIN_RATE_ACCURACY, day + MIN_RATE_ACCURACY)) ]
+                currency IN ({})
+            ORDER BY
+                currency, day
+        """.format(", ".join("?" * len(currencies))), currencies)
 
-        if (
-            self._todays_rates is not None and
-            currency in self._todays_rates and
-            day - MIN_RATE_ACCURACY <= today <= day + MIN_RATE_ACCURACY
-        ):
-            rates.append((today,) + self._todays_rates[currency])
+        loaded_indexes = {currency: _CurrencyIndex(row[1:] for row in currency_rows)
+                          for currency, currency_rows in itertools.groupby(rows, key=lambda row: row[0])}
+
+        # Another thread may have already loaded and used some of the indexes, so they must not be replaced
+        for currency in currencies:
+            indexes.setdefault(currency, loaded_indexes.get(currency) or _CurrencyIndex(()))
+
+    def __load_todays_rates(self):
+        """
+        Loads today's rates from the intraday cache. Returns the rates and
+        time when the oldest of them have been downloaded.
+        """
+
+        db = self.__get_db()
+        today = util.get_day(datetime.date.today())
+
+        rates = {}
+        for currency, sell_rate, buy_rate in db.execute("""
+            SELECT
+                currency,
+                sell_rate,
+                buy_rate
+            FROM
+                intraday_rates
+            INNER JOIN
+                intraday_log USING (source)
+            WHERE
+                day = ?
+        """, (today,)):
+            rates[currency] = (_from_fixed_point(sell_rate), _from_fixed_point(buy_rate))
+
+        updated, = db.execute("SELECT MIN(updated) FROM intraday_log WHERE day = ?", (today,)).fetchone()
+
+        return rates, updated
+
+    def __update_in_background(self, deadline):
+        """Updates currency rate info in a background thread."""
+
+        try:
+            self.__update(deadline)
+        except Exception as e:
+            log.error("%s", Error("Unable to update rate info.").append(e))
+        finally:
+            self.__close_thread_db()
+
+    def __update(self, deadline=None):
+        """Updates currency rate info holding the cross-process update lock.
+
+        If another thread or process is updating the database, waits for it to
+        complete and downloads only the data that it hasn't got. If the lock
+        can't be acquired before the deadline, the existing data is used.
+
+        Returns True if today's rates are up to date after the update, False if
+        it has failed to get some of them or None if there was no update.
+        """
+
+        with self._update_lock, _lock_update(self._lock_path, deadline) as locked:
+            if locked:
+                return self.__update_locked(deadline)
+            else:
+                log.warning("Rate info hasn't been updated: another process is updating it for too long.")
+
+    def __update_locked(self, deadline):
+        """Updates currency rate info.
+
+        Downloads rates only for the (source, date) pairs that haven't been
+        fetched yet, have failed (see FETCH_ATTEMPTS) or had no data and aren't
+        final yet (see EMPTY_DAY_FINALIZATION_DAYS). The download
+        stops at the deadline, so the remaining dates are postponed until the
+        next run.
+
+        Returns True if today's rates are up to date after the update (they
+        aren't if a source has failed to return them during the TTL).
+        """
+
+        db = self.__get_db()
+        today = datetime.date.today()
+        min_date = today - datetime.timedelta(ARCHIVE_PERIOD_AT_FIRST_START)
+
+        # Today's rates are requested at most once during the TTL (even if the request has failed)
+        min_update_time = time.time() - self._todays_rates_ttl
+        failed_sources = {source for source, in db.execute(
+            "SELECT source FROM intraday_failures WHERE day = ? AND checked > ?",
+            (util.get_day(today), min_update_time))}
+        up_to_date_sources = failed_sources | {source for source, in db.execute(
+            "SELECT source FROM intraday_log WHERE day = ? AND updated > ?",
+            (util.get_day(today), min_update_time))}
+
+        if db.execute("SELECT 1 FROM fetch_log LIMIT 1").fetchone() is None:
+            log.info("Downloading currency rate archive. It may take a lot of time, please wait...")
+
+        jobs = []
+
+        for source in _SOURCES:
+            done_days = {day for day, in db.execute("""
+                SELECT
+                    day
+                FROM
+                    fetch_log
+                WHERE
+                    source = :source AND :min_day <= day AND (
+                        status = :fetched OR
+                        status = :failed AND attempts >= :attempts AND checked + MIN(
+                            :retry_interval << MIN(attempts - :attempts, 30), :max_retry_interval) > :today OR
+                        status = :empty AND (checked >= day + :finalization_days OR checked >= :today)
+                    )
+            """, {
+                "source": source.NAME,
+                "min_day": util.get_day(min_date),
+                "today": util.get_day(today),
+                "fetched": FETCH_STATUS_FETCHED,
+                "failed": FETCH_STATUS_FAILED,
+                "empty": FETCH_STATUS_EMPTY,
+                "attempts": FETCH_ATTEMPTS,
+                "retry_interval": FAILED_DAY_RETRY_INTERVAL,
+                "max_retry_interval": FAILED_DAY_MAX_RETRY_INTERVAL,
+                "finalization_days": EMPTY_DAY_FINALIZATION_DAYS,
+            })}
+
+            dates = []
+            date = min_date
+            while date <= today:
+                # Today's rates may change, so we get them unless they've been downloaded recently
+                if (
+                    date == today and source.NAME not in up_to_date_sources or
+                    date != today and util.get_day(date) not in done_days
+                ):
+                    dates.append(date)
+                date += datetime.timedelta(1)
+
+            bulk = hasattr(source, "get_rates_for_period") and len(dates) >= BULK_DOWNLOAD_MIN_DAYS
+            jobs.append((source, dates, bulk))
+
+        todays_rates = {}
+        todays_failures = set()
+        failures = {}
+
+        network.set_deadline(deadline)
+
+        try:
+            # Each batch is committed separately, so an interrupted download will continue from the last checkpoint
+            for source_name, source_rates, errors in backfill.download(
+                jobs, self._download_workers, deadline=deadline
+            ):
+                rates = {}
+                fetch_log = []
+
+                for date, day_rates in source_rates.items():
+                    if date == today:
+                        todays_rates[source_name] = day_rates
+                    else:
+                        rates[date] = day_rates
+                        fetch_log.append((source_name, date, FETCH_STATUS_FETCHED if day_rates else FETCH_STATUS_EMPTY))
+
+                for source_name, date, error in errors:
+                    if date == today:
+                        todays_failures.add(source_name)
+                    else:
+                        fetch_log.append((source_name, date, FETCH_STATUS_FAILED))
+
+                    failed_days, _ = failures.get(source_name, (0, None))
+                    failures[source_name] = (failed_days + 1, error)
+
+                if fetch_log:
+                    self.__add(rates, fetch_log)
+        finally:
+            network.set_deadline(None)
+
+        if todays_rates or todays_failures:
+            self.__add_todays_rates(todays_rates, todays_failures)
+
+        # A source may be down for a long time, so report its failures with a single message
+        for source_name, (failed_days, error) in sorted(failures.items()):
+            log.error("Failed to get %s rate info for %s days. They will be retried later. The last error: %s",
+                      source_name, failed_days, util.EE(error))
+
+        return not failed_sources and all(source.NAME in todays_rates for source, dates, bulk in jobs if today in dates)
+
+
+class _CurrencyIndex:
+    """Sorted in-memory time series of a currency's rates."""
+
+    def __init__(self, rows):
+        self.__days = []
+        self.__rates = []
+
+        for day, sell_rate, buy_rate in rows:
+            self.__days.append(day)
+            self.__rates.append((_from_fixed_point(sell_rate), _from_fixed_point(buy_rate)))
+
+    def find_nearest(self, day):
+        """
+        Returns a (day, rates) tuple for the nearest to the specified day date
+        within MIN_RATE_ACCURACY days or None if there is no such date.
+        """
+
+        pos = bisect.bisect_left(self.__days, day)
 
         nearest = None
-        for rate in rates:
-            if nearest is None or abs(day - rate[0]) < abs(day - nearest[0]):
-                nearest = rate
+        for candidate in (pos - 1, pos):
+            if (
+                0 <= candidate < len(self.__days) and
+                abs(day - self.__days[candidate]) <= MIN_RATE_ACCURACY and
+                (nearest is None or abs(day - self.__days[candidate]) < abs(day - self.__days[nearest]))
+            ):
+                nearest = candidate
 
         if nearest is None:
             return None
         else:
-            return (Decimal(nearest[1]), Decimal(nearest[2]))
+            return self.__days[nearest], self.__rates[nearest]
 
-    @classmethod
-    def set_db_dir(cls, path):
-        """Sets custom database directory."""
 
-        cls._db_dir = path
+def _connect(db_path):
+    """Opens the database (see _init_db() for its initialization)."""
 
-    def __add(self, rates):
-        """Saves new rate info."""
+    db = sqlite3.connect(db_path)
+    db.execute("PRAGMA synchronous = NORMAL")
+    return db
 
-        data = []
 
-        for date, currencies in rates.items():
-            for currency, rates in currencies.items():
-                data.append((
-                    util.get_day(date),
-                    currency, str(rates[0]), str(rates[1])
-                ))
+@contextlib.contextmanager
+def _lock_update(lock_path, deadline):
+    """Acquires the cross-process update lock.
 
-        self._db.executemany("INSERT INTO rates VALUES (?, ?, ?, ?)", data)
-        self._db.commit()
+    Returns True if the lock has been acquired or False if it hasn't been
+    acquired before the deadline.
+    """
 
-    def __update(self):
-        """Updates currency rate info."""
+    with open(lock_path, "a") as lock_file:
+        waiting = False
 
-        last_date = self._db.execute("SELECT MAX(day) FROM rates").fetchone()[0]
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if deadline is not None and time.time() >= deadline:
+                    yield False
+                    return
 
-        if last_date:
-            min_date = datetime.date.fromtimestamp(0) + datetime.timedelta(last_date + 1)
-        else:
-            log.info("Downloading currency rate archive. It may take a lot of time, please wait...")
-            min_date = datetime.date.today() - datetime.timedelta(ARCHIVE_PERIOD_AT_FIRST_START)
+                if not waiting:
+                    log.info("The rate archive is being updated by another process. Waiting for it...")
+                    waiting = True
 
-        dates = []
-        date = min_date
-        today = datetime.date.today()
-        while date <= today:
-            dates.append(date)
-            date += datetime.timedelta(1)
+                time.sleep(UPDATE_LOCK_POLL_INTERVAL)
+            else:
+                break
 
-        rates = {}
-        for source in (cbrf, sbrf):
-            for date, new_rates in source.get_rates(dates).items():
-                rates.setdefault(date, {}).update(new_rates)
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
-        todays_rates = rates.pop(today, {})
 
-        if rates:
-            self.__add(rates)
+def _init_db(db, lock_path):
+    """Creates the database schema or migrates it to the current version.
+
+    The database is switched to WAL mode, so readers aren't blocked by the
+    process that updates it. Several processes may open a new database at
+    the same time, so all of this is done under the update lock.
+    """
+
+    if db.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+        return
+
+    with _lock_update(lock_path, None):
+        db.execute("PRAGMA journal_mode = WAL")
 
-        return todays_rates
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if version == SCHEMA_VERSION:
+            return
+        elif version > SCHEMA_VERSION:
+            raise Error("The database has an unsupported schema version ({}).", version)
+
+        _migrate(db, version)
+
+
+def _migrate(db, version):
+    """Migrates the database schema from the specified version to the current one."""
+
+    legacy = db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rates'").fetchone() is not None
+    if legacy:
+        log.info("Migrating the rate archive to a new database schema...")
+
+    db.execute("BEGIN")
+
+    try:
+        for migration_version, migrate in (
+            (2, _migrate_to_v2),
+            (3, _migrate_to_v3),
+            (4, _migrate_to_v4),
+            (5, _migrate_to_v5),
+            (6, _migrate_to_v6),
+        ):
+            if version < migration_version:
+                migrate(db)
+
+        db.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+    except Exception:
+        db.rollback()
+        raise
+    else:
+        db.commit()
+
+    if legacy:
+        db.execute("VACUUM")
+
+
+def _migrate_to_v2(db):
+    """Creates a compact rate table (migrating data from the legacy one if it exists)."""
+
+    legacy = db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rates'").fetchone() is not None
+
+    if legacy:
+        db.execute("DROP INDEX IF EXISTS rate_index")
+        db.execute("ALTER TABLE rates RENAME TO rates_v1")
+
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS rates (
+            currency TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            sell_rate INTEGER NOT NULL,
+            buy_rate INTEGER NOT NULL,
+            PRIMARY KEY (currency, day)
+        ) WITHOUT ROWID
+    """)
+
+    if legacy:
+        # The first row wins for duplicates as it did in the previous versions
+        db.executemany("""
+            INSERT OR IGNORE INTO rates (currency, day, sell_rate, buy_rate) VALUES (?, ?, ?, ?)
+        """, [
+            (currency, day, _to_fixed_point(Decimal(sell_rate)), _to_fixed_point(Decimal(buy_rate)))
+            for currency, day, sell_rate, buy_rate in db.execute(
+                "SELECT currency, day, sell_rate, buy_rate FROM rates_v1 ORDER BY rowid").fetchall()
+        ])
+        db.execute("DROP TABLE rates_v1")
+
+
+def _migrate_to_v3(db):
+    """Creates the fetch log and fills it with the days that are already in the archive."""
+
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS fetch_log (
+            source TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            PRIMARY KEY (source, day)
+        ) WITHOUT ROWID
+    """)
+
+    # Days without any data will be fetched once again to fill the possible gaps
+    db.execute("""
+        INSERT OR IGNORE INTO fetch_log (source, day, status, attempts)
+        SELECT DISTINCT
+            CASE
+                WHEN currency IN ('USD_SBRF', 'EUR_SBRF') THEN :sbrf_currency
+                WHEN currency LIKE '%\\_SBRF' ESCAPE '\\' THEN :sbrf_metal
+                ELSE :cbrf
+            END,
+            day, :fetched, 1
+        FROM
+            rates
+    """, {
+        "sbrf_currency": sbrf.CURRENCY_SOURCE_NAME,
+        "sbrf_metal": sbrf.METAL_SOURCE_NAME,
+        "cbrf": cbrf.NAME,
+        "fetched": FETCH_STATUS_FETCHED,
+    })
+
+
+def _migrate_to_v4(db):
+    """Adds the day of the last check to the fetch log."""
+
+    if "checked" not in {column[1] for column in db.execute("PRAGMA table_info(fetch_log)")}:
+        db.execute("ALTER TABLE fetch_log ADD COLUMN checked INTEGER NOT NULL DEFAULT 0")
+
+    # We don't know when the existing records have been checked, so assume that only the recent ones aren't final
+    db.execute("UPDATE fetch_log SET checked = MIN(day + ?, ?)",
+               (EMPTY_DAY_FINALIZATION_DAYS, util.get_day(datetime.date.today())))
+
+
+def _migrate_to_v5(db):
+    """Creates the intraday cache of today's rates."""
+
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS intraday_log (
+            source TEXT NOT NULL PRIMARY KEY,
+            day INTEGER NOT NULL,
+            updated INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS intraday_rates (
+            source TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            sell_rate INTEGER NOT NULL,
+            buy_rate INTEGER NOT NULL,
+            PRIMARY KEY (source, currency)
+        ) WITHOUT ROWID
+    """)
+
+
+def _migrate_to_v6(db):
+    """Creates the log of failed attempts to get today's rates."""
+
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS intraday_failures (
+            source TEXT NOT NULL PRIMARY KEY,
+            day INTEGER NOT NULL,
+            checked INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+
+def _from_fixed_point(value):
+    """Converts a rate stored in the database to Decimal."""
+
+    return Decimal(value).scaleb(-RATE_SCALE)
+
+
+def _to_fixed_point(rate):
+    """Converts a rate to its database representation."""
+
+    return int(rate.scaleb(RATE_SCALE).to_integral_value())
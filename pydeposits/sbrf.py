@@ -3,8 +3,12 @@
 """Contains tools for getting rate info from Sberbank."""
 
 import datetime
+import json
 import logging
+import os
 import re
+import threading
+import time
 
 from decimal import Decimal
 
@@ -14,25 +18,31 @@ from requests import RequestException
 import xlrd
 from xlrd import XL_CELL_EMPTY as EMPTY, XL_CELL_TEXT as TEXT, XL_CELL_NUMBER as NUMBER
 
-from pydeposits.util import Error, fetch_url
+from pydeposits import blob_store
+from pydeposits.network import DeadlineExceeded, fetch_url
+from pydeposits.util import Error
 from pydeposits.xls import RowNotFoundError, find_table, cmp_columns, cmp_column_types
 
 log = logging.getLogger(__name__)
 
 
-def get_rates(dates):
-    """Returns Sberbank's rates for the specified dates."""
+CURRENCY_SOURCE_NAME = "Sberbank currency"
+"""Name of the Sberbank currency rates source."""
 
-    rates = {}
-    sources = (_CurrencyRates(), _MetalRates())
+METAL_SOURCE_NAME = "Sberbank metal"
+"""Name of the Sberbank metal rates source."""
 
-    for date in dates:
-        for source in sources:
-            day_rates = source.get_for_date(date)
-            if day_rates:
-                rates.setdefault(date, {}).update(day_rates)
+MONTH_INDEX_TTL = 60 * 60
+"""Time (in seconds) during which a cached index of a not yet closed month is considered fresh."""
 
-    return rates
+MONTH_INDEX_FINALIZATION_DAYS = 3
+"""Number of days after a month end since which its index is considered immutable."""
+
+MONTH_INDEX_RETRY_INTERVAL = 10 * 60
+"""
+Time (in seconds) during which a failed month index request isn't repeated
+(the error is reported for all the days of the month instead).
+"""
 
 
 def _get_tinkoff_rates():
@@ -60,9 +70,29 @@ class _SberbankRates:
 
     def __init__(self):
         super(_SberbankRates, self).__init__()
-        self.__month_urls_cache = {}
+        self.__month_urls_lock = threading.Lock()
+        self.__month_index_errors = {}
 
     def get_for_date(self, date):
+        job = self._download(date)
+        if job is None:
+            return
+
+        function, args = job
+        return function(*args)
+
+    def get_rates_for_date(self, date):
+        return self.get_for_date(date) or {}
+
+    def fetch_for_date(self, date):
+        # Returns a (function, args) job that parses the downloaded data in a separate process or None if there is
+        # no data for the date.
+        return self._download(date)
+
+    def get_reparse_jobs(self, responses):
+        return [(_reparse_xls, (self.NAME, response.date, response.url, response.path)) for response in responses]
+
+    def _download(self, date):
         if date < self._min_supported_date:
             return
 
@@ -84,41 +114,71 @@ class _SberbankRates:
                 else:
                     raise Error("Failed to get Sberbank currency rates from {}: {}.", url, e)
             else:
+                blob_store.save(self.NAME, date, url, xls_contents)
                 break
         else:
             return
 
-        try:
-            rates = self.parse(xls_contents)
-        except Exception as e:
-            raise Error("Error while reading Sberbank currency rates obtained from {}: {}", url, e)
+        return _parse_xls, (self.NAME, url, xls_contents)
 
-        log.debug("Gotten rates: %s", rates)
+    def _get_urls(self, date):
+        key = "{}:{}.{:02d}".format(self._name, date.year, date.month)
 
-        return rates
+        # Serialize the requests to not download the same month index from several threads
+        with self.__month_urls_lock:
+            index = _month_index_cache.get(key)
 
-    def _get_urls(self, date):
-        month_id = (date.year, date.month)
+            if index is None or not _is_month_index_fresh(index):
+                error_time, error = self.__month_index_errors.get(key, (None, None))
+                if error is not None and time.time() - error_time < MONTH_INDEX_RETRY_INTERVAL:
+                    raise error
 
-        try:
-            day_urls = self.__month_urls_cache[month_id]
-        except KeyError:
-            try:
-                day_urls = self._get_month_urls(date)
-            except Exception as e:
-                raise Error("Unable to obtain a list of *.xls for {} rates for {:02d}.{}: {}.",
-                            self._name, date.month, date.year, e)
+                try:
+                    index = self._get_month_index(date, index)
+                except Exception as e:
+                    error = Error("Unable to obtain a list of *.xls for {} rates for {:02d}.{}: {}.",
+                                  self._name, date.month, date.year, e)
 
-            self.__month_urls_cache[month_id] = day_urls
+                    if not isinstance(e, DeadlineExceeded):
+                        self.__month_index_errors[key] = (time.time(), error)
 
-        return day_urls.get(date.day, [])
+                    raise error
 
-    def _get_month_urls(self, date):
+                self.__month_index_errors.pop(key, None)
+                _month_index_cache.put(key, index)
+
+        return index["urls"].get(str(date.day), [])
+
+    def _get_month_index(self, date, cached_index):
         month_rates_url = "{prefix}moscow/ru/quotes/{archive}/index.php?year115={year}&month115={month}".format(
             prefix=self.__url_prefix, archive=self._sberbank_archive_name, year=date.year, month=date.month)
 
-        rate_list_html = fetch_url(month_rates_url).text
+        headers = {}
+        if cached_index is not None:
+            if cached_index.get("etag"):
+                headers["If-None-Match"] = cached_index["etag"]
+            if cached_index.get("last_modified"):
+                headers["If-Modified-Since"] = cached_index["last_modified"]
+
+        response = fetch_url(month_rates_url, headers=headers)
+
+        if response.status_code == requests.codes.not_modified and cached_index is not None:
+            log.debug("%s hasn't been modified.", month_rates_url)
+            index = dict(cached_index)
+        else:
+            day_urls = self._get_month_urls(date, month_rates_url, response.text)
+            index = {"urls": {str(day): urls for day, urls in day_urls.items()}}
+
+        index.update({
+            "etag": response.headers.get("ETag", index.get("etag")),
+            "last_modified": response.headers.get("Last-Modified", index.get("last_modified")),
+            "checked": time.time(),
+            "final": _is_month_closed(date),
+        })
 
+        return index
+
+    def _get_month_urls(self, date, month_rates_url, rate_list_html):
         base_url = "/common/img/uploaded/banks/uploaded_mb/c_list/{}/download/".format(self._sberbank_rates_list_name)
 
         rate_url_matches = list(re.finditer(
@@ -158,6 +218,7 @@ class _SberbankRates:
 
 
 class _CurrencyRates(_SberbankRates):
+    NAME = CURRENCY_SOURCE_NAME
     _name = "currency"
     _sberbank_archive_name = "archivecurrencies"
     _sberbank_rates_list_name = "vkurs"
@@ -177,8 +238,17 @@ class _CurrencyRates(_SberbankRates):
                 log.info("%s Falling back to Tinkoff...", error)
                 return _get_tinkoff_rates()
             else:
-                log.error("%s", error)
-                return {}
+                raise
+
+    def fetch_for_date(self, date):
+        today = datetime.date.today()
+        yesterday = today - datetime.timedelta(days=1)
+
+        # Process the dates for which we may fall back to Tinkoff on any error in place
+        if date in (today, yesterday):
+            return self.get_for_date(date) or {}
+
+        return super(_CurrencyRates, self).fetch_for_date(date)
 
     def _parse(self, sheet):
         try:
@@ -230,6 +300,7 @@ class _CurrencyRates(_SberbankRates):
 
 
 class _MetalRates(_SberbankRates):
+    NAME = METAL_SOURCE_NAME
     _name = "metal"
 
     _sberbank_archive_name = "archivoms"
@@ -268,6 +339,73 @@ class _MetalRates(_SberbankRates):
         return rates
 
 
+SOURCES = (_CurrencyRates(), _MetalRates())
+"""Sberbank rate sources (they cache month URL lists, so are shared between requests)."""
+
+
+def set_cache_dir(path):
+    """Sets a directory for persistent caching of Sberbank month indexes."""
+
+    _month_index_cache.load(os.path.join(path, "sberbank_month_indexes.json"))
+
+
+class _MonthIndexCache:
+    """Cache of Sberbank month indexes that may be stored on disk."""
+
+    def __init__(self):
+        self.__path = None
+        self.__indexes = {}
+        self.__lock = threading.Lock()
+
+    def load(self, path):
+        with self.__lock:
+            self.__path = path
+
+            try:
+                with open(path) as cache_file:
+                    self.__indexes = json.load(cache_file)
+            except FileNotFoundError:
+                self.__indexes = {}
+            except Exception as e:
+                log.warning("Unable to load Sberbank month index cache from '%s': %s.", path, e)
+                self.__indexes = {}
+
+    def get(self, key):
+        with self.__lock:
+            return self.__indexes.get(key)
+
+    def put(self, key, index):
+        with self.__lock:
+            self.__indexes[key] = index
+
+            if self.__path is None:
+                return
+
+            temp_path = "{}.{}".format(self.__path, os.getpid())
+
+            try:
+                with open(temp_path, "w") as cache_file:
+                    json.dump(self.__indexes, cache_file)
+                os.replace(temp_path, self.__path)
+            except Exception as e:
+                log.warning("Unable to save Sberbank month index cache to '%s': %s.", self.__path, e)
+
+
+_month_index_cache = _MonthIndexCache()
+"""Sberbank month index cache."""
+
+
+def _is_month_closed(date):
+    # Sberbank may publish reports for the last days of a month with a delay
+
+    next_month = (date.replace(day=1) + datetime.timedelta(days=31)).replace(day=1)
+    return datetime.date.today() >= next_month + datetime.timedelta(days=MONTH_INDEX_FINALIZATION_DAYS)
+
+
+def _is_month_index_fresh(index):
+    return index["final"] or time.time() - index["checked"] < MONTH_INDEX_TTL
+
+
 def _is_month_may_be_empty(date):
     # Month may be empty if it's only starting and there are
     # some holidays in the first days.
@@ -285,3 +423,20 @@ def _is_month_may_be_empty(date):
             today.month == 5 and (today - datetime.date(today.year, today.month, 1)).days <= 8
         )
     )
+
+
+def _parse_xls(source_name, url, xls_contents):
+    source, = (source for source in SOURCES if source.NAME == source_name)
+
+    try:
+        rates = source.parse(xls_contents)
+    except Exception as e:
+        raise Error("Error while reading Sberbank currency rates obtained from {}: {}", url, e)
+
+    log.debug("Gotten rates: %s", rates)
+
+    return rates
+
+
+def _reparse_xls(source_name, date, url, path):
+    return {date: _parse_xls(source_name, url, blob_store.load(path))}
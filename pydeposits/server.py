@@ -0,0 +1,217 @@
+"""Serves deposit statements and currency rates via a local HTTP JSON API.
+
+The deposits and the rate archive are kept in memory between the requests,
+while currency rates are refreshed in background on a schedule.
+
+GET /statement[?all=1][&today=DAY]       - deposit statement
+GET /expiring?days=DAYS[&today=DAY]      - deposits that will be expired in DAYS days
+GET /rates?currency=CURRENCY[&date=DAY]  - currency rates for the date
+
+Dates are in constants.DATE_FORMAT format, decimals are returned as strings.
+"""
+
+import datetime
+import http.server
+import json
+import logging
+import threading
+import urllib.parse
+
+from decimal import Decimal
+
+import pydeposits.statements
+
+from pydeposits import constants
+from pydeposits.rate_archive import RateArchive
+from pydeposits.util import EE, Error
+
+log = logging.getLogger(__name__)
+
+
+def serve(deposits, address=constants.SERVER_ADDRESS, port=constants.SERVER_PORT,
+          refresh_interval=constants.RATES_REFRESH_INTERVAL):
+    """Serves the API until the process is interrupted."""
+
+    server = make_server(deposits, address, port)
+
+    stopped = threading.Event()
+    threading.Thread(target=_refresh_rates, args=(refresh_interval, stopped),
+                     name="Rate refresh", daemon=True).start()
+
+    log.info("Serving on http://%s:%s/...", *server.server_address[:2])
+
+    try:
+        server.serve_forever()
+    finally:
+        stopped.set()
+        server.server_close()
+
+
+def make_server(deposits, address, port):
+    """Creates the API server warming up the rate archive."""
+
+    # Loads the rate indexes for all the deposits' currencies
+    pydeposits.statements.get_account_statement(deposits, datetime.date.today(), True)
+
+    return _Server((address, port), deposits)
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    """The API server."""
+
+    daemon_threads = True
+
+    def __init__(self, address, deposits):
+        super(_Server, self).__init__(address, _Handler)
+        self.deposits = deposits
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Handles the API requests."""
+
+    protocol_version = "HTTP/1.1"
+
+    # Headers and body are sent separately, so Nagle's algorithm delays keep-alive responses
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+
+        handler = _HANDLERS.get(url.path)
+        if handler is None:
+            self.__reply(404, {"error": "Unknown request."})
+            return
+
+        try:
+            result = handler(self.server.deposits, query)
+        except Error as e:
+            self.__reply(400, {"error": EE(e)})
+        except Exception as e:
+            log.exception("Failed to process %s request.", self.path)
+            self.__reply(500, {"error": EE(e)})
+        else:
+            self.__reply(200, result)
+
+    def log_message(self, format, *args):
+        log.debug("%s: " + format, self.address_string(), *args)
+
+    def __reply(self, status, result):
+        body = json.dumps(result, default=_to_json, ensure_ascii=False).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _get_statement(deposits, query):
+    """Handles statement requests."""
+
+    today = _get_date(query, "today")
+    rows, totals = pydeposits.statements.get_account_statement(deposits, today, query.get("all") == "1")
+
+    return {
+        "today": today,
+        "holdings": [_get_holding_info(row) for row in rows],
+        "totals": totals,
+        "rates_as_of": RateArchive().get_stale_rates_time(),
+    }
+
+
+def _get_expiring(deposits, query):
+    """Handles expiring deposits requests."""
+
+    try:
+        days = int(query["days"])
+        if days < 0:
+            raise Exception("negative number")
+    except Exception:
+        raise Error("Invalid number of days ({}).", query.get("days"))
+
+    today = _get_date(query, "today")
+
+    return {
+        "today": today,
+        "holdings": [_get_holding_info(holding)
+                     for holding in pydeposits.statements.get_expiring(deposits, today, days)],
+    }
+
+
+def _get_rates(deposits, query):
+    """Handles currency rates requests."""
+
+    currency = query.get("currency")
+    if not currency:
+        raise Error("Currency is not specified.")
+
+    date = _get_date(query, "date")
+    rates = RateArchive().get_approx(currency, date)
+
+    return {
+        "currency": currency,
+        "date": date,
+        "sell": None if rates is None else rates[0],
+        "buy": None if rates is None else rates[1],
+    }
+
+
+_HANDLERS = {
+    "/statement": _get_statement,
+    "/expiring":  _get_expiring,
+    "/rates":     _get_rates,
+}
+"""Request handlers by path."""
+
+
+def _get_date(query, name):
+    """Returns a date from the query (today by default)."""
+
+    value = query.get(name)
+    if value is None:
+        return datetime.date.today()
+
+    try:
+        return datetime.datetime.strptime(value, constants.DATE_FORMAT).date()
+    except ValueError:
+        raise Error("Invalid {} date ({}).", name, value)
+
+
+def _get_holding_info(holding):
+    """Returns holding info (Holding or HoldingInfo) for an API response."""
+
+    info = {
+        key: getattr(holding, key) for key in (
+            "bank", "currency", "source_currency", "open_date", "close_date", "amount", "cost", "interest",
+            "rate_profit", "current_amount", "current_cost", "pure_profit", "pure_profit_percent",
+        ) if getattr(holding, key, None) is not None
+    }
+
+    info["closed"] = holding.closed
+    info["expired"] = getattr(holding, "expired", False)
+
+    return info
+
+
+def _refresh_rates(interval, stopped):
+    """Refreshes currency rates every interval seconds."""
+
+    while not stopped.wait(interval):
+        try:
+            RateArchive().update()
+        except Exception as e:
+            log.error("%s", EE(e))
+
+
+def _to_json(value):
+    """Converts the values that aren't supported by JSON encoder."""
+
+    if isinstance(value, Decimal):
+        return str(value)
+    elif isinstance(value, datetime.datetime):
+        return value.strftime(constants.DATE_FORMAT + " %H:%M:%S")
+    elif isinstance(value, datetime.date):
+        return value.strftime(constants.DATE_FORMAT)
+    else:
+        raise TypeError("{!r} is not JSON serializable.".format(value))
@@ -1,7 +1,10 @@
 """Provides a tools for getting deposit statements."""
 
-import copy
+import csv
 import datetime
+import json
+import logging
+import sys
 import time
 
 from decimal import Decimal
@@ -9,12 +12,29 @@ from decimal import Decimal
 from pcli.text_table import Table, Column
 
 import pydeposits.constants as constants
+import pydeposits.vectorized as vectorized
 from pydeposits.rate_archive import RateArchive
 from pydeposits.util import Error
 
+log = logging.getLogger(__name__)
 
-def print_account_statement(holdings, today, show_all):
-    """Prints out current deposit statement."""
+VECTORIZED_MIN_HOLDINGS = 1000
+"""
+Minimum number of holdings for which the vectorized engine is used when it's
+enabled (it rounds the values differently, so it's disabled by default).
+"""
+
+_HISTORY_TOTAL_KEYS = ("cost", "current_cost", "pure_profit")
+"""Total values that are printed by print_history()."""
+
+_HISTORY_HOLDING_KEYS = (
+    "bank", "currency", "open_date", "close_date", "closed", "amount", "cost", "interest", "rate_profit",
+    "current_amount", "current_cost", "pure_profit", "pure_profit_percent")
+"""Holding values that are printed by print_history()."""
+
+
+def print_account_statement(holdings, today, show_all, use_numpy=False):
+    """Prints out current deposit statement (see get_account_statement())."""
 
     table = Table([
         Column("expired",             "Expiration",         align=Column.ALIGN_CENTER, hide_if_empty=True),
@@ -33,237 +53,493 @@ def print_account_statement(holdings, today, show_all):
         Column("pure_profit_percent", "Pure profit persent"                                              ),
     ])
 
-    holdings = copy.deepcopy(holdings)
-    holdings.sort(key=_holding_cmp_key)
+    rows, totals = get_account_statement(holdings, today, show_all, use_numpy)
+
+    for row in rows:
+        table.add_row(_get_table_row(row))
+
+    table.add_row({})
+    table.add_row(totals)
+
+    print(); table.draw("Account statement for {0}:".format(today))
+
+    if rows:
+        stale_rates_time = RateArchive().get_stale_rates_time()
+        if stale_rates_time is not None:
+            print("\nToday's currency rates are as of {0} (unable to update them).".format(
+                stale_rates_time.strftime(constants.DATE_FORMAT + " %H:%M")))
+
+
+def get_account_statement(holdings, today, show_all, use_numpy=False):
+    """Calculates current deposit statement.
+
+    Returns a (rows, totals) tuple, where rows is a list of HoldingInfo with
+    the calculated (rounded) info and totals is a dict with the total cost,
+    current cost and pure profit of the opened holdings.
+
+    If use_numpy is True, large statements are calculated by the vectorized
+    engine (see pydeposits.vectorized), which is faster, but may differ from
+    the default Decimal one in rounding.
+    """
+
+    holdings = sorted(holdings, key=_holding_cmp_key)
+    shown = _get_shown_holdings(holdings, today, show_all)
+
+    context = ValuationContext()
+    context.prefetch([
+        (holding.currency, date)
+        for holding, _, _, holding_today in shown
+        for date in (holding.open_date, holding_today)
+    ])
+
+    statement = _calculate_statement(shown, context, use_numpy=use_numpy)
+    context.log_stats()
+
+    return statement
+
+
+def print_history(holdings, from_date, to_date, show_all, per_holding=False, output_format="csv"):
+    """Prints out deposit statement history in CSV or JSON format.
+
+    Prints total cost, current cost and pure profit for each day of the
+    period or info about each holding for each day if per_holding is True.
+    """
+
+    history = get_history(holdings, from_date, to_date, show_all)
+
+    if output_format == "csv":
+        writer = csv.writer(sys.stdout)
+
+        if per_holding:
+            writer.writerow(("date",) + _HISTORY_HOLDING_KEYS)
+            for today, rows, totals in history:
+                for row in rows:
+                    writer.writerow([_format_history_value(today)] + [
+                        _format_history_value(getattr(row, key)) for key in _HISTORY_HOLDING_KEYS])
+        else:
+            writer.writerow(("date",) + _HISTORY_TOTAL_KEYS)
+            for today, rows, totals in history:
+                writer.writerow([_format_history_value(today)] + [
+                    _format_history_value(totals[key]) for key in _HISTORY_TOTAL_KEYS])
+    elif output_format == "json":
+        days = []
+
+        for today, rows, totals in history:
+            day = {"date": _format_history_value(today)}
+            day.update((key, _format_history_value(totals[key])) for key in _HISTORY_TOTAL_KEYS)
+
+            if per_holding:
+                day["holdings"] = [{
+                    key: _format_history_value(getattr(row, key)) for key in _HISTORY_HOLDING_KEYS
+                } for row in rows]
+
+            days.append(day)
+
+        json.dump(days, sys.stdout, indent=4, ensure_ascii=False)
+        print()
+    else:
+        raise Error("Invalid output format: {}.", output_format)
 
-    total = Decimal(0)
-    total_profit = Decimal(0)
-    current_total = Decimal(0)
 
+def get_history(holdings, from_date, to_date, show_all):
+    """Calculates deposit statement for each day of the period.
+
+    Yields a (today, rows, totals) tuple for each day (see
+    get_account_statement()). Interest on the holdings is accrued
+    incrementally from day to day and rates for the whole period are resolved
+    in one batch, so each day costs about the same regardless of the
+    holdings' age.
+    """
+
+    holdings = sorted(holdings, key=_holding_cmp_key)
+    days = [from_date + datetime.timedelta(day) for day in range((to_date - from_date).days + 1)]
+
+    requests = set()
     for holding in holdings:
-        opened = not holding.get("closed", False)
-        expired = ( holding.get("close_date", today) < today )
+        requests.add((holding.currency, holding.open_date))
+        if holding.close_date is not None:
+            requests.add((holding.currency, holding.close_date))
+    requests.update((currency, today) for currency in {currency for currency, date in requests} for today in days)
 
-        if today < holding["open_date"] or not show_all and not opened:
-            continue
+    context = ValuationContext()
+    context.prefetch(requests)
+    accruals = {}
 
-        holding["open_date_string"] = holding["open_date"].strftime(constants.DATE_FORMAT)
-        if "close_date" in holding:
-            holding["close_date_string"] = holding["close_date"].strftime(constants.DATE_FORMAT)
+    for today in days:
+        rows, totals = _calculate_statement(_get_shown_holdings(holdings, today, show_all), context, accruals)
+        yield today, rows, totals
 
-            if expired:
-                holding["expired"] = "Expired"
+    context.log_stats()
 
-        _calculate_holding_info(holding, holding["close_date"] if expired else today)
 
-        if opened:
-            total += holding.get("cost", 0)
-            current_total += holding.get("current_cost", 0)
-            total_profit += holding.get("pure_profit", 0)
+class ValuationContext:
+    """Resolves currency rates for a statement calculation.
 
-        for key in ("amount", "cost", "rate_profit", "current_amount", "current_cost", "pure_profit"):
-            if key in holding:
-                holding[key] = _round_normal(holding[key])
+    Rates for each (currency, date) pair are looked up in the rate archive
+    only once and then are taken from the context. rates is an optional dict
+    of already known {(currency, date): rates}.
+    """
 
-        for key in ("interest", "pure_profit_percent"):
-            if key in holding:
-                holding[key] = _round_precise(holding[key])
+    def __init__(self, rates=None):
+        # Number of rate lookups that have been served from the context and
+        # resolved by the rate archive
+        self.hits = 0
+        self.misses = 0
 
-        holding["closed"] = "" if opened else "x"
-        table.add_row(holding)
+        self.__archive = None
+        self.__rates = {} if rates is None else dict(rates)
 
-    table.add_row({})
-    table.add_row({
+    def get_rates(self, currency, date):
+        """Returns rates for the currency and date (see RateArchive.get_approx())."""
+
+        try:
+            rates = self.__rates[(currency, date)]
+        except KeyError:
+            self.misses += 1
+            rates = self.__rates[(currency, date)] = self.__get_archive().get_approx(currency, date)
+        else:
+            self.hits += 1
+
+        return rates
+
+    def prefetch(self, requests):
+        """Resolves rates for the specified (currency, date) pairs in one batch."""
+
+        requests = sorted(set(requests).difference(self.__rates))
+        if not requests:
+            return
+
+        self.misses += len(requests)
+        self.__rates.update(self.__get_archive().get_approx_many(requests))
+
+    def log_stats(self):
+        """Logs rate lookup statistics."""
+
+        log.debug("Rate lookups: %s hits, %s misses.", self.hits, self.misses)
+
+    def __get_archive(self):
+        if self.__archive is None:
+            self.__archive = RateArchive()
+
+        return self.__archive
+
+
+class HoldingInfo:
+    """Calculated info about a holding.
+
+    The values that can't be calculated are None. The holding's fields are
+    accessible as the info's attributes.
+    """
+
+    __slots__ = ("holding", "opened", "expired", "amount", "interest", "cost", "past_cost", "rate_profit",
+                 "current_amount", "current_cost", "pure_profit", "pure_profit_percent")
+
+    def __init__(self, holding, opened=True, expired=False):
+        self.holding = holding
+        self.opened = opened
+        self.expired = expired
+        self.amount = holding.amount
+        self.interest = holding.interest
+        self.cost = None
+        self.past_cost = None
+        self.rate_profit = None
+        self.current_amount = None
+        self.current_cost = None
+        self.pure_profit = None
+        self.pure_profit_percent = None
+
+    def __getattr__(self, name):
+        if name == "holding":
+            raise AttributeError(name)
+
+        return getattr(self.holding, name)
+
+
+def _calculate_statement(shown, context, accruals=None, use_numpy=False):
+    """Calculates deposit statement for the holdings (see get_account_statement()).
+
+    shown is a list of (holding, opened, expired, holding's today) tuples.
+    If accruals dict is specified, interest on the holdings is accrued
+    incrementally using the accrual states stored in it.
+    """
+
+    total = Decimal(0)
+    total_profit = Decimal(0)
+    current_total = Decimal(0)
+
+    rows = [HoldingInfo(holding, opened, expired) for holding, opened, expired, _ in shown]
+
+    calculated = set()
+    if use_numpy and accruals is None and len(shown) >= VECTORIZED_MIN_HOLDINGS:
+        batch = [(info, holding_today) for info, (holding, _, _, holding_today) in zip(rows, shown)
+                 if vectorized.is_supported(holding)]
+        vectorized.calculate_holding_info(batch, context)
+        calculated.update(id(info) for info, _ in batch)
+
+    for info, (holding, opened, expired, holding_today) in zip(rows, shown):
+        if id(info) not in calculated:
+            if accruals is None:
+                accrual = None
+            else:
+                accrual = accruals.get(id(holding))
+                if accrual is None:
+                    accrual = accruals[id(holding)] = _Accrual(holding)
+
+            _calculate_holding_info(info, holding_today, context, accrual)
+
+        if opened:
+            if info.cost is not None:
+                total += info.cost
+            if info.current_cost is not None:
+                current_total += info.current_cost
+            if info.pure_profit is not None:
+                total_profit += info.pure_profit
+
+        info.amount = _round_normal(info.amount)
+        info.cost = _round_normal(info.cost)
+        info.rate_profit = _round_normal(info.rate_profit)
+        info.current_amount = _round_normal(info.current_amount)
+        info.current_cost = _round_normal(info.current_cost)
+        info.pure_profit = _round_normal(info.pure_profit)
+
+        info.interest = _round_precise(info.interest)
+        info.pure_profit_percent = _round_precise(info.pure_profit_percent)
+
+    totals = {
         "cost":         _round_normal(total),
         "current_cost": _round_normal(current_total),
         "pure_profit":  _round_normal(total_profit),
-    })
+    }
 
-    print(); table.draw("Account statement for {0}:".format(today))
+    return rows, totals
 
 
 def print_expiring(holdings, today, days):
     """Prints out holdings that will be expired in specified number of days."""
 
+    expiring = get_expiring(holdings, today, days)
+
+    if expiring:
+        print("Following deposits will be expired in {0} days:".format(days))
+
+        for holding in expiring:
+            print("  * {0} {1} ({2})".format(
+                holding.close_date.strftime(constants.DATE_FORMAT),
+                holding.bank, holding.currency))
+
+
+def get_expiring(holdings, today, days):
+    """Returns holdings that will be expired in specified number of days."""
+
     expiring = []
 
     for holding in sorted(holdings, key=_holding_cmp_key, reverse=True):
         if (
-            not holding.get("closed", False) and
-            "close_date" in holding and
-            holding["close_date"] <= today + datetime.timedelta(days)
+            not holding.closed and
+            holding.close_date is not None and
+            holding.close_date <= today + datetime.timedelta(days)
         ):
             expiring.append(holding)
 
-    if expiring:
-        print("Following deposits will be expired in {0} days:".format(days))
-
-        for holding in expiring:
-            print("  * {0} {1} ({2})".format(
-                holding["close_date"].strftime(constants.DATE_FORMAT),
-                holding["bank"], holding["currency"]))
+    return expiring
 
 
-def _calculate_current_amount(holding, today):
-    """Calculates current amount and profit on a holding."""
+def _calculate_current_amount(holding, today, accrual=None):
+    """Returns current amount of a holding.
 
-    open_date = holding["open_date"]
+    If accrual is specified, it's used to continue the calculation from the
+    day it has been done for the last time.
+    """
 
-    if "close_date" in holding and holding["close_date"] < today:
-        to_date = holding["close_date"]
+    if holding.close_date is not None and holding.close_date < today:
+        to_date = holding.close_date
     else:
         to_date = today
 
-    per_day = holding.get("interest", Decimal(0)) / 100 / _days_in_year(open_date.year)
+    if accrual is None:
+        accrual = _Accrual(holding)
+
+    return accrual.get_current_amount(to_date)
 
-    profit = 0
-    amount = holding["amount"]
 
-    month = -1
-    cur_date = open_date
-    next_date = cur_date
-    completions = holding.get("completions", [])[:]
+class _Accrual:
+    """Accrues interest on a holding.
 
-    while True:
-        if next_date > to_date:
-            next_date = to_date
+    The timeline is split into segments by capitalization periods and
+    completions, and interest for each segment is calculated at once, so the
+    calculation cost depends on the number of the events rather than days.
+    The state is kept between the calculations, so the holding may be
+    evaluated for a series of days without starting from its open date.
+    """
 
-        if completions:
-            while cur_date <= next_date:
-                while completions and completions[0]["date"] == cur_date:
-                    completion = completions.pop(0)
-                    amount += completion["amount"]
+    def __init__(self, holding):
+        self.__holding = holding
+        self.__completions = holding.completions or ()
+        self.__per_day = (holding.interest or Decimal(0)) / 100 / _days_in_year(holding.open_date.year)
 
-                if cur_date == next_date:
-                    break
+        self.__profit = 0
+        self.__amount = holding.amount
 
-                profit += amount * per_day
-                cur_date += datetime.timedelta(1)
-        else:
-            profit += amount * per_day * (next_date - cur_date).days
-            cur_date = next_date
+        self.__month = -1
+        self.__cur_date = holding.open_date
+        self.__next_date = self.__cur_date
+        self.__completion_id = 0
+
+    def get_current_amount(self, to_date):
+        """
+        Returns current amount for the date. The dates must be passed in
+        non-decreasing order.
+        """
+
+        if to_date < self.__cur_date:
+            raise Error("Logical error.")
+
+        holding = self.__holding
+        completions = self.__completions
+        per_day = self.__per_day
+
+        while True:
+            next_date = min(self.__next_date, to_date)
+
+            # Completions are accounted at the beginning of their day
+            while self.__completion_id < len(completions) and completions[self.__completion_id].date <= next_date:
+                completion = completions[self.__completion_id]
+                self.__profit += self.__amount * per_day * (completion.date - self.__cur_date).days
+                self.__amount += completion.amount
+                self.__cur_date = completion.date
+                self.__completion_id += 1
+
+            if next_date < self.__next_date:
+                # The date is inside of the current period, so the state is left at its last event
+                profit = self.__profit + self.__amount * per_day * (next_date - self.__cur_date).days
+                return self.__amount + profit
+
+            self.__profit += self.__amount * per_day * (next_date - self.__cur_date).days
+            self.__cur_date = next_date
 
-        if cur_date == to_date:
-            amount += profit
-            break
+            if self.__cur_date == to_date:
+                return self.__amount + self.__profit
 
-        month += 1
-        if "capitalization" in holding and month and month % holding["capitalization"] == 0:
-            amount += profit
-            profit = 0
+            self.__month += 1
+            if holding.capitalization is not None and self.__month and self.__month % holding.capitalization == 0:
+                self.__amount += self.__profit
+                self.__profit = 0
 
-        next_date_year = cur_date.year
-        next_date_month = cur_date.month + 1
+            self.__next_date = self.__get_next_date()
+
+    def __get_next_date(self):
+        """Returns end of the next monthly period."""
+
+        next_date_year = self.__cur_date.year
+        next_date_month = self.__cur_date.month + 1
         if next_date_month > 12:
             next_date_year += 1
             next_date_month = 1
-        next_date_day = open_date.day
+        next_date_day = self.__holding.open_date.day
 
         while True:
             try:
-                next_date = datetime.date(next_date_year, next_date_month, next_date_day)
+                return datetime.date(next_date_year, next_date_month, next_date_day)
             except ValueError:
                 next_date_day -= 1
                 if next_date_day < 0:
                     raise Error("Logical error.")
-            else:
-                break
-
-    holding["current_amount"] = amount
 
 
-def _calculate_current_cost(holding, today):
+def _calculate_current_cost(info, today, context):
     """Calculates current cost of a holding (in a local currency)."""
 
-    rate_archive = RateArchive()
-    cur_rates = rate_archive.get_approx(holding["currency"], today)
+    cur_rates = context.get_rates(info.holding.currency, today)
     if cur_rates is not None:
         # TODO: bank interest
-        holding["current_cost"] = holding["current_amount"] * cur_rates[1]
+        info.current_cost = info.current_amount * cur_rates[1]
 
 
-def _calculate_holding_info(holding, today):
-    """Calculates various info about a holding."""
+def _calculate_holding_info(info, today, context, accrual=None):
+    """Calculates various info about a holding using the valuation context."""
 
-    _calculate_past_cost(holding, today)
-    _calculate_rate_profit(holding, today)
-    _calculate_current_amount(holding, today)
-    _calculate_current_cost(holding, today)
-    _calculate_pure_profit(holding, today)
+    holding = info.holding
 
+    _calculate_past_cost(info, today, context)
+    _calculate_rate_profit(info, today, context)
+    info.current_amount = _calculate_current_amount(holding, today, accrual)
+    _calculate_current_cost(info, today, context)
+    _calculate_pure_profit(info, today)
 
-    rate_archive = RateArchive()
+    for completion in holding.completions or ():
+        if completion.date <= today:
+            info.amount += completion.amount
 
-    for completion in holding.get("completions", []):
-        if completion["date"] <= today:
-            holding["amount"] += completion["amount"]
-
-    cur_rates = rate_archive.get_approx(holding["currency"], today)
+    cur_rates = context.get_rates(holding.currency, today)
     if cur_rates is not None:
-        holding["cost"] = holding["amount"] * cur_rates[1]
+        info.cost = info.amount * cur_rates[1]
 
 
-def _calculate_past_cost(holding, today):
+def _calculate_past_cost(info, today, context):
     """
     Calculates cost of a holding (in a local currency) for the time, when it
     was opened.
     """
 
-    source_currency = holding.get("source_currency", holding["currency"])
+    holding = info.holding
+    source_currency = holding.source_currency or holding.currency
 
-    if source_currency == constants.LOCAL_CURRENCY and holding["currency"] == constants.LOCAL_CURRENCY:
-        holding["past_cost"] = holding["amount"]
-    elif source_currency == constants.LOCAL_CURRENCY and "source_amount" in holding:
-        holding["past_cost"] = holding["source_amount"]
+    if source_currency == constants.LOCAL_CURRENCY and holding.currency == constants.LOCAL_CURRENCY:
+        info.past_cost = holding.amount
+    elif source_currency == constants.LOCAL_CURRENCY and holding.source_amount is not None:
+        info.past_cost = holding.source_amount
     else:
-        past_rates = RateArchive().get_approx(holding["currency"], holding["open_date"])
+        past_rates = context.get_rates(holding.currency, holding.open_date)
 
         if past_rates is not None:
             if source_currency == constants.LOCAL_CURRENCY:
-                holding["past_cost"] = past_rates[0] * holding["amount"]
-            elif source_currency == holding["currency"]:
-                holding["past_cost"] = past_rates[1] * holding["amount"]
+                info.past_cost = past_rates[0] * holding.amount
+            elif source_currency == holding.currency:
+                info.past_cost = past_rates[1] * holding.amount
             else:
                 # TODO FIXME
                 raise Error("Not supported")
 
-    for completion in holding.get("completions", []):
-        if completion["date"] <= today:
-            if holding["currency"] == constants.LOCAL_CURRENCY:
-                holding["past_cost"] += completion["amount"]
+    for completion in holding.completions or ():
+        if completion.date <= today:
+            if holding.currency == constants.LOCAL_CURRENCY:
+                info.past_cost += completion.amount
             else:
                 # TODO FIXME
                 raise Error("Not supported")
 
 
-def _calculate_pure_profit(holding, today):
+def _calculate_pure_profit(info, today):
     """Calculates pure profit from a holding for today."""
 
-    if "past_cost" in holding and "current_cost" in holding:
-        holding["pure_profit"] = holding["current_cost"] - holding["past_cost"]
+    holding = info.holding
+
+    if info.past_cost is not None and info.current_cost is not None:
+        info.pure_profit = info.current_cost - info.past_cost
 
-        if "completions" not in holding:
+        if holding.completions is None:
             # TODO ?
-            if holding["past_cost"] == 0 or today == holding["open_date"]:
-                holding["pure_profit_percent"] = Decimal(0)
+            if info.past_cost == 0 or today == holding.open_date:
+                info.pure_profit_percent = Decimal(0)
             else:
-                holding["pure_profit_percent"] = (holding["pure_profit"] / holding["past_cost"]) * 100 \
-                                                 / (today - holding["open_date"]).days * _days_in_year(today.year)
+                info.pure_profit_percent = (info.pure_profit / info.past_cost) * 100 \
+                                           / (today - holding.open_date).days * _days_in_year(today.year)
 
 
-def _calculate_rate_profit(holding, today):
+def _calculate_rate_profit(info, today, context):
     """Calculates rate profit for a holding."""
 
-    source_currency = holding.get("source_currency", holding["currency"])
+    holding = info.holding
+    source_currency = holding.source_currency or holding.currency
 
     if (
-        (source_currency != constants.LOCAL_CURRENCY or holding["currency"] != constants.LOCAL_CURRENCY) and
-        "past_cost" in holding
+        (source_currency != constants.LOCAL_CURRENCY or holding.currency != constants.LOCAL_CURRENCY) and
+        info.past_cost is not None
     ):
-        cur_rates = RateArchive().get_approx(holding["currency"], today)
+        cur_rates = context.get_rates(holding.currency, today)
 
         if cur_rates is not None:
-            holding["rate_profit"] = cur_rates[1] * holding["amount"] - holding["past_cost"]
+            info.rate_profit = cur_rates[1] * holding.amount - info.past_cost
 
 
 def _days_in_year(year):
@@ -272,13 +548,76 @@ def _days_in_year(year):
     return 366 if _is_leap_year(year) else 365
 
 
+def _format_history_value(value):
+    """Formats a value for print_history()."""
+
+    if value is None:
+        return ""
+    elif isinstance(value, bool):
+        return "x" if value else ""
+    elif isinstance(value, datetime.date):
+        return value.strftime(constants.DATE_FORMAT)
+    else:
+        return str(value)
+
+
+def _get_shown_holdings(holdings, today, show_all):
+    """
+    Returns a list of (holding, opened, expired, holding's today) tuples for
+    the holdings that should be shown in the statement.
+    """
+
+    shown = []
+
+    for holding in holdings:
+        opened = not holding.closed
+        expired = ( holding.close_date is not None and holding.close_date < today )
+
+        if today < holding.open_date or not show_all and not opened:
+            continue
+
+        shown.append((holding, opened, expired, holding.close_date if expired else today))
+
+    return shown
+
+
+def _get_table_row(info):
+    """Returns a statement table row for a holding."""
+
+    row = {
+        key: value for key, value in (
+            ("bank",                info.bank),
+            ("currency",            info.currency),
+            ("amount",              info.amount),
+            ("cost",                info.cost),
+            ("interest",            info.interest),
+            ("rate_profit",         info.rate_profit),
+            ("current_amount",      info.current_amount),
+            ("current_cost",        info.current_cost),
+            ("pure_profit",         info.pure_profit),
+            ("pure_profit_percent", info.pure_profit_percent),
+        ) if value is not None
+    }
+
+    row["open_date_string"] = info.open_date.strftime(constants.DATE_FORMAT)
+    if info.close_date is not None:
+        row["close_date_string"] = info.close_date.strftime(constants.DATE_FORMAT)
+
+        if info.expired:
+            row["expired"] = "Expired"
+
+    row["closed"] = "" if info.opened else "x"
+
+    return row
+
+
 def _holding_cmp_key(holding):
     """Compares two holdings (for printing them out)."""
 
     return (
-        "close_date" in holding,
-        -time.mktime(holding.get("close_date", datetime.date.today()).timetuple()),
-        holding["bank"]
+        holding.close_date is not None,
+        -time.mktime((holding.close_date or datetime.date.today()).timetuple()),
+        holding.bank
     )
 
 
@@ -2,11 +2,6 @@
 
 import datetime
 
-import requests
-from requests import RequestException
-
-from pydeposits import constants
-
 
 class Error(Exception):
     """The base class for all exceptions that our code throws."""
@@ -67,18 +62,13 @@ def EE(e):
     return error
 
 
-def get_day(date):
-    """Converts a date to day number from UNIX epoch."""
+def get_date(day):
+    """Converts a day number from UNIX epoch to a date."""
 
-    return (date - datetime.date.fromtimestamp(0)).days
+    return datetime.date.fromtimestamp(0) + datetime.timedelta(day)
 
 
-def fetch_url(url):
-    """Fetches the specified URL."""
-
-    response = requests.get(url, timeout=constants.NETWORK_TIMEOUT)
-    if response.status_code != requests.codes.ok:
-        raise RequestException("Server returned an error: {} {}".format(response.status_code, response.reason),
-                               response=response)
+def get_day(date):
+    """Converts a date to day number from UNIX epoch."""
 
-    return response
+    return (date - datetime.date.fromtimestamp(0)).days
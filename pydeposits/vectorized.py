@@ -0,0 +1,195 @@
+"""Vectorized valuation of large portfolios (requires NumPy).
+
+Calculates the same info as statements._calculate_holding_info() for all the
+holdings at once: the portfolio is loaded into column arrays and interest is
+accrued month by month for all the holdings simultaneously in floating point
+arithmetic. The results are rounded to 6 decimal places.
+
+Holdings with completions aren't supported and must be calculated by the
+ordinary Decimal engine (see is_supported()).
+"""
+
+import datetime
+
+from decimal import Decimal
+
+from pydeposits import constants
+from pydeposits.util import Error
+
+numpy = None
+"""NumPy module (imported on first use: the import is too slow for ordinary statements)."""
+
+_PRECISION = -6
+"""Precision of the calculated values (a decimal exponent)."""
+
+_EPOCH = datetime.date(1970, 1, 1)
+"""Epoch of NumPy months."""
+
+
+def is_available():
+    """Returns True if NumPy is installed (importing it on the first call)."""
+
+    global numpy
+
+    if numpy is None:
+        try:
+            import numpy as module
+        except ImportError:
+            return False
+
+        numpy = module
+
+    return True
+
+
+def is_supported(holding):
+    """Returns True if the holding can be calculated by the vectorized engine."""
+
+    return holding.completions is None and (holding.source_currency or holding.currency) in (
+        constants.LOCAL_CURRENCY, holding.currency)
+
+
+def calculate_holding_info(infos, context):
+    """
+    Calculates various info about the holdings using the valuation context
+    (see statements.ValuationContext). infos is a list of (HoldingInfo, today)
+    tuples.
+    """
+
+    if not infos:
+        return
+
+    if not is_available():
+        raise Error("NumPy is not installed.")
+
+    local_currency = constants.LOCAL_CURRENCY
+    nan = float("nan")
+    columns = []
+
+    for info, today in infos:
+        holding = info.holding
+        open_date = holding.open_date
+        currency = holding.currency
+        source_currency = holding.source_currency or currency
+        past_rates = context.get_rates(currency, open_date)
+        cur_rates = context.get_rates(currency, today)
+
+        columns.append((
+            holding.amount, holding.interest or 0, holding.capitalization or 0,
+            open_date.year, (open_date.year - _EPOCH.year) * 12 + open_date.month - 1, open_date.day,
+            open_date.toordinal(), today.toordinal(), today.year,
+            today.toordinal() if holding.close_date is None else min(holding.close_date, today).toordinal(),
+            source_currency == local_currency, currency == local_currency,
+            nan if holding.source_amount is None else holding.source_amount,
+            nan if past_rates is None else past_rates[0], nan if past_rates is None else past_rates[1],
+            nan if cur_rates is None else cur_rates[1],
+        ))
+
+    (
+        amount, interest, capitalization,
+        open_year, open_month, open_month_day,
+        open_day, today_day, today_year, to_day,
+        source_local, currency_local, source_amount,
+        past_sell_rate, past_buy_rate, cur_buy_rate,
+    ) = numpy.array(columns, dtype=numpy.float64).T
+
+    open_year, open_month, open_month_day, open_day, today_day, today_year, to_day, capitalization = (
+        column.astype(numpy.int64) for column in (
+            open_year, open_month, open_month_day, open_day, today_day, today_year, to_day, capitalization))
+    source_local = source_local.astype(bool)
+    currency_local = currency_local.astype(bool)
+
+    current_amount = _accrue(amount, interest / 100 / _days_in_year(open_year),
+                             capitalization, open_month, open_month_day, open_day, to_day)
+
+    past_cost = numpy.where(
+        source_local & currency_local, amount, numpy.where(
+            source_local & ~numpy.isnan(source_amount), source_amount, numpy.where(
+                source_local, past_sell_rate * amount, past_buy_rate * amount)))
+
+    rate_profit = numpy.where(source_local & currency_local, numpy.nan, cur_buy_rate * amount - past_cost)
+    current_cost = current_amount * cur_buy_rate
+    cost = amount * cur_buy_rate
+
+    pure_profit = current_cost - past_cost
+    held_days = today_day - open_day
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        pure_profit_percent = numpy.where(
+            (past_cost == 0) | (held_days == 0), 0,
+            pure_profit / past_cost * 100 / held_days * _days_in_year(today_year))
+    pure_profit_percent[numpy.isnan(pure_profit)] = numpy.nan
+
+    for key, values in (
+        ("current_amount", current_amount),
+        ("past_cost", past_cost),
+        ("rate_profit", rate_profit),
+        ("current_cost", current_cost),
+        ("pure_profit", pure_profit),
+        ("pure_profit_percent", pure_profit_percent),
+        ("cost", cost),
+    ):
+        # NaN means that the value can't be calculated
+        known = ~numpy.isnan(values)
+        values = _to_micros(numpy.where(known, values, 0))
+
+        for (info, today), value, value_known in zip(infos, values, known.tolist()):
+            if value_known:
+                setattr(info, key, Decimal(value).scaleb(_PRECISION))
+
+
+def _accrue(amount, per_day, capitalization, open_month, open_month_day, open_day, to_day):
+    """Accrues interest month by month for all the holdings at once.
+
+    open_month is a number of months and open_day and to_day are ordinals of
+    the days since the epoch.
+
+    Monthly periods start at the open date's day of month (or at the last day
+    of the month if it's shorter), profit is capitalized every capitalization
+    months.
+    """
+
+    # Ordinals of the first days of all the months that may be needed
+    first_month = int(open_month.min())
+    month_count = int(open_month.max()) - first_month + int((to_day - open_day).max()) // 28 + 3
+    month_starts = (numpy.datetime64(_EPOCH, "M") + numpy.arange(first_month, first_month + month_count)).astype(
+        "datetime64[D]").astype(numpy.int64) + _EPOCH.toordinal()
+    month_lengths = numpy.diff(month_starts)
+
+    amount = amount.copy()
+    profit = numpy.zeros_like(amount)
+    period_start = open_day.copy()
+
+    month = 1
+    while True:
+        # End of the next monthly period
+        month_id = open_month - first_month + month
+        period_end = month_starts[month_id] + numpy.minimum(open_month_day, month_lengths[month_id]) - 1
+
+        active = period_end < to_day
+        if not active.any():
+            break
+
+        profit += numpy.where(active, amount * per_day * (period_end - period_start), 0)
+        period_start = numpy.where(active, period_end, period_start)
+
+        capitalized = active & (capitalization > 0) & (month % numpy.maximum(capitalization, 1) == 0)
+        amount = numpy.where(capitalized, amount + profit, amount)
+        profit = numpy.where(capitalized, 0, profit)
+
+        month += 1
+
+    profit += amount * per_day * (to_day - period_start)
+
+    return amount + profit
+
+
+def _days_in_year(year):
+    """Returns number of days in the years."""
+
+    return numpy.where((year % 4 == 0) & (year % 100 != 0) | (year % 400 == 0), 366, 365)
+
+
+def _to_micros(values):
+    """Converts calculated values to a list of integers with the calculation precision."""
+
+    return numpy.rint(values * 10 ** -_PRECISION).astype(numpy.int64).tolist()
@@ -1,5 +1,17 @@
 """Provides various utils for working with *.xls files."""
 
+import hashlib
+
+
+LAYOUT_CACHE_SIZE = 64
+"""Maximum number of cached table locations."""
+
+_FINGERPRINT_ROWS = 10
+"""Number of header rows that are included into a sheet fingerprint."""
+
+_table_locations = {}
+"""Cached table locations by (table template, sheet fingerprint)."""
+
 
 class RowNotFoundError(Exception):
     def __init__(self):
@@ -16,14 +28,57 @@ def find_row(sheet, columns_template):
 
 
 def find_table(sheet, table_template):
-    row_id, column_id = find_row(sheet, table_template[0])
-    for line, columns_template in enumerate(table_template[1:], start=1):
-        if not cmp_columns(sheet, row_id + line, column_id, columns_template):
+    """Finds a table with the specified header.
+
+    Files of the same layout usually have the table at the same place, so the
+    location is cached by a sheet fingerprint and the full scan is done only
+    if the cached location doesn't match the template.
+    """
+
+    key = (table_template, get_fingerprint(sheet))
+
+    location = _table_locations.get(key)
+    if location is not None and _cmp_table(sheet, *location, table_template):
+        row_id, column_id = location
+    else:
+        row_id, column_id = find_row(sheet, table_template[0])
+        if not _cmp_table(sheet, row_id, column_id, table_template):
             raise RowNotFoundError()
 
+        if len(_table_locations) >= LAYOUT_CACHE_SIZE:
+            _table_locations.clear()
+
+        _table_locations[key] = (row_id, column_id)
+
     return row_id, row_id + len(table_template), column_id
 
 
+def get_fingerprint(sheet):
+    """
+    Returns a cheap fingerprint of the sheet layout: its dimensions and a hash
+    of cell types and text of the header rows (numbers like dates are ignored).
+    """
+
+    header = hashlib.sha1()
+
+    for row_id in range(min(sheet.nrows, _FINGERPRINT_ROWS)):
+        header.update(repr(sheet.row_types(row_id)).encode())
+        header.update(repr([value for value in sheet.row_values(row_id) if isinstance(value, str)]).encode())
+
+    return sheet.nrows, sheet.ncols, header.hexdigest()
+
+
+def _cmp_table(sheet, row_id, column_id, table_template):
+    if row_id + len(table_template) > sheet.nrows:
+        return False
+
+    for line, columns_template in enumerate(table_template):
+        if not cmp_columns(sheet, row_id + line, column_id, columns_template):
+            return False
+
+    return True
+
+
 def _find_columns(sheet, row_id, columns_template):
     columns = _strip_values(sheet.row_values(row_id))
 
@@ -24,6 +24,7 @@ with open("README") as readme:
         url="https://github.com/KonishchevDmitry/pydeposits",
 
         install_requires=["pcli >= 0.2", "requests", "xlrd"],
+        extras_require={"numpy": ["numpy"]},
 
         author="Dmitry Konishchev",
         author_email="konishchev@gmail.com",
@@ -4,7 +4,31 @@ import pytest
 
 import pcli.log
 
+from pydeposits import blob_store
+from pydeposits.rate_archive import RateArchive
+
 
 @pytest.fixture(autouse=True, scope="session")
 def test():
     pcli.log.setup(debug_mode=True, level=logging.WARN)
+
+
+@pytest.fixture
+def db_dir(tmpdir, monkeypatch):
+    monkeypatch.setattr(RateArchive, "_db", None)
+    monkeypatch.setattr(RateArchive, "_update_thread", None)
+    monkeypatch.setattr(RateArchive, "_background_update", False)
+    monkeypatch.setattr(RateArchive, "_indexes", {})
+    monkeypatch.setattr(RateArchive, "_todays_rates", None)
+    monkeypatch.setattr(RateArchive, "_todays_rates_time", None)
+    monkeypatch.setattr(RateArchive, "_todays_rates_ttl", 0)
+    monkeypatch.setattr(RateArchive, "_todays_rates_updated", None)
+    monkeypatch.setattr(RateArchive, "_db_dir", str(tmpdir))
+    monkeypatch.setattr(RateArchive, "_offline_mode", True)
+    monkeypatch.setattr(blob_store, "_store_dir", None)
+    monkeypatch.setattr(blob_store, "_index", None)
+
+    yield tmpdir
+
+    if RateArchive._db is not None:
+        RateArchive._db.close()
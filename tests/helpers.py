@@ -0,0 +1,54 @@
+import datetime
+
+from decimal import Decimal
+
+from pydeposits import constants, statements
+from pydeposits.deposits import Completion, Holding
+
+
+def generate_holding(rand, currencies=(constants.LOCAL_CURRENCY,), completions=True):
+    open_date = datetime.date(2010, 1, 1) + datetime.timedelta(rand.randrange(6 * 365))
+
+    fields = {
+        "bank": "Bank",
+        "open_date": open_date,
+        "currency": rand.choice(currencies),
+        "amount": Decimal(rand.randrange(100, 10 ** 7)).scaleb(-2),
+        "interest": Decimal(rand.randrange(0, 2000)).scaleb(-2),
+    }
+
+    if rand.random() < 0.7:
+        fields["close_date"] = open_date + datetime.timedelta(rand.randrange(1, 3 * 365))
+
+    if rand.random() < 0.5:
+        fields["capitalization"] = Decimal(rand.choice((1, 1, 3, 6, 12)))
+
+    if fields["currency"] != constants.LOCAL_CURRENCY and rand.random() < 0.5:
+        fields["source_currency"] = constants.LOCAL_CURRENCY
+        if rand.random() < 0.5:
+            fields["source_amount"] = fields["amount"] * 30
+
+    if completions and rand.random() < 0.8:
+        max_days = (fields["close_date"] - open_date).days if "close_date" in fields else 3 * 365
+        fields["completions"] = tuple(sorted((
+            Completion(
+                open_date + datetime.timedelta(rand.randrange(max_days)),
+                Decimal(rand.randrange(100, 10 ** 6)).scaleb(-2),
+            ) for _ in range(rand.randrange(6))
+        ), key=lambda completion: completion.date))
+
+    return Holding(**fields)
+
+
+def generate_rates(rand, currency):
+    if currency == constants.LOCAL_CURRENCY:
+        rates = (Decimal(1), Decimal(1))
+    else:
+        buy_rate = Decimal(rand.randrange(2000, 8000)).scaleb(-2)
+        rates = (buy_rate + 1, buy_rate)
+
+    return rates if rand.random() < 0.9 else None
+
+
+def get_values(info):
+    return {name: getattr(info, name) for name in statements.HoldingInfo.__slots__}
@@ -0,0 +1,186 @@
+import datetime
+import threading
+import time
+
+from decimal import Decimal
+
+import pytest
+
+from pydeposits import backfill
+from pydeposits.util import Error
+
+
+class FakeSource:
+    def __init__(self, name, failed_dates=()):
+        self.NAME = name
+        self.__failed_dates = failed_dates
+
+    def get_rates_for_date(self, date):
+        if date in self.__failed_dates:
+            raise Error("Failed to get rates for {}.", date)
+
+        return {self.NAME: (Decimal(date.day), Decimal(date.day))}
+
+
+def test_download():
+    dates = [datetime.date(2016, 1, 1) + datetime.timedelta(days) for days in range(30)]
+    failed_date = dates[10]
+
+    rates, errors = {}, []
+
+    for source_name, batch_rates, batch_errors in backfill.download(
+        [(FakeSource("A"), dates, False), (FakeSource("B", (failed_date,)), dates[5:], False)], 4, batch_size=7
+    ):
+        assert 0 < len(batch_rates) + len(batch_errors) <= 7
+
+        for date, day_rates in batch_rates.items():
+            assert date not in rates.setdefault(source_name, {})
+            rates[source_name][date] = day_rates
+
+        errors.extend(batch_errors)
+
+    assert sorted(rates["A"]) == dates
+    assert sorted(rates["B"]) == [date for date in dates[5:] if date != failed_date]
+    assert rates["A"][dates[0]] == {"A": (1, 1)}
+    assert rates["A"][failed_date] == {"A": (11, 11)}
+
+    assert [(source, date) for source, date, error in errors] == [("B", failed_date)]
+
+
+class FakePeriodSource(FakeSource):
+    def __init__(self, name, fail=False):
+        super().__init__(name)
+        self.period_requests = []
+        self.__fail = fail
+
+    def get_rates_for_period(self, dates):
+        self.period_requests.append(dates)
+        if self.__fail:
+            raise Error("Failed to get rates for the period.")
+
+        return {date: self.get_rates_for_date(date) for date in dates[1:]}
+
+
+@pytest.mark.parametrize("fail", (False, True))
+def test_bulk_download(fail):
+    dates = [datetime.date(2016, 1, 1) + datetime.timedelta(days) for days in range(30)]
+    source = FakePeriodSource("A", fail=fail)
+
+    rates = {}
+    for source_name, batch_rates, batch_errors in backfill.download([(source, dates, True)], 4, batch_size=7):
+        assert not batch_errors and len(batch_rates) <= 7
+        rates.update(batch_rates)
+
+    assert source.period_requests == [dates]
+    assert sorted(rates) == dates
+
+    if fail:
+        assert rates[dates[0]] == {"A": (1, 1)}
+    else:
+        # The source has no data for the first date
+        assert rates[dates[0]] == {}
+
+
+def parse_fake_response(name, day):
+    return {name: (Decimal(day), Decimal(day))}
+
+
+class FakePipelinedSource(FakeSource):
+    def fetch_for_date(self, date):
+        rates = self.get_rates_for_date(date)
+
+        if date.day == 1:
+            # Some days may be parsed right in the download worker
+            return rates
+
+        if date.day == 2:
+            return parse_fake_response, (self.NAME, "invalid")
+
+        return parse_fake_response, (self.NAME, date.day)
+
+
+def test_pipelined_download(monkeypatch):
+    monkeypatch.setattr(backfill, "PIPELINE_QUEUE_SIZE", 3)
+
+    dates = [datetime.date(2016, 1, 1) + datetime.timedelta(days) for days in range(20)]
+    failed_date = dates[5]
+
+    rates, errors = {}, []
+    for source_name, batch_rates, batch_errors in backfill.download(
+        [(FakePipelinedSource("A", (failed_date,)), dates, False)], 4, batch_size=7
+    ):
+        assert 0 < len(batch_rates) + len(batch_errors) <= 7
+        rates.update(batch_rates)
+        errors.extend(batch_errors)
+
+    assert sorted(rates) == [date for date in dates if date not in (dates[1], failed_date)]
+    assert rates[dates[0]] == {"A": (1, 1)}
+    assert rates[dates[10]] == {"A": (11, 11)}
+    assert sorted(date for source, date, error in errors) == [dates[1], failed_date]
+
+
+class SlowSource(FakeSource):
+    def __init__(self, name, slow_dates):
+        super().__init__(name)
+        self.slow_dates = slow_dates
+        self.unblocked = threading.Event()
+
+    def get_rates_for_date(self, date):
+        if date in self.slow_dates:
+            self.unblocked.wait(5)
+
+        return super().get_rates_for_date(date)
+
+
+def test_download_deadline():
+    dates = [datetime.date(2016, 1, 1) + datetime.timedelta(days) for days in range(10)]
+    source = SlowSource("A", dates[5:])
+
+    start_time = time.time()
+    rates = {}
+
+    try:
+        for source_name, batch_rates, batch_errors in backfill.download(
+            [(source, dates, False)], 2, deadline=start_time + 0.5
+        ):
+            assert not batch_errors
+            rates.update(batch_rates)
+    finally:
+        source.unblocked.set()
+
+    assert time.time() - start_time < 2
+    assert sorted(rates) == dates[:5]
+
+
+
+class ExpiringSource(FakeSource):
+    def __init__(self, name, deadline, expiring_dates):
+        super().__init__(name)
+        self.deadline = deadline
+        self.expiring_dates = expiring_dates
+
+    def get_rates_for_date(self, date):
+        if date in self.expiring_dates:
+            # Network requests fail immediately after the deadline
+            time.sleep(max(0, self.deadline - time.time()))
+            raise Error("Time limit for network requests is exceeded.")
+
+        return super().get_rates_for_date(date)
+
+
+def test_download_failures_after_deadline():
+    dates = [datetime.date(2016, 1, 1) + datetime.timedelta(days) for days in range(10)]
+    deadline = time.time() + 0.3
+    source = ExpiringSource("A", deadline, dates[5:])
+
+    rates = {}
+    for source_name, batch_rates, batch_errors in backfill.download(
+        [(source, dates, False)], 2, batch_size=1, deadline=deadline
+    ):
+        assert not batch_errors
+        rates.update(batch_rates)
+
+        # The consumer is busy when the deadline is reached, so the failed downloads are already completed
+        time.sleep(max(0, deadline - time.time()) + 0.1)
+
+    assert sorted(rates) == dates[:5]
@@ -0,0 +1,116 @@
+import datetime
+import os
+import xml.dom.minidom
+
+from decimal import Decimal
+
+import pytest
+
+from pydeposits import cbrf
+from pydeposits.util import Error
+
+DATA_PATH = os.path.dirname(__file__)
+
+
+def parse_with_minidom(xml_contents):
+    """The original DOM-based parser which is used as a reference implementation."""
+
+    dom = xml.dom.minidom.parseString(xml_contents)
+
+    date_rates = {}
+
+    for currency in dom.getElementsByTagName("Valute"):
+        for node in currency.getElementsByTagName("CharCode")[0].childNodes:
+            if node.nodeType == node.TEXT_NODE:
+                name = node.data
+                break
+        else:
+            raise Error("Unable to get currency name.")
+
+        for node in currency.getElementsByTagName("Value")[0].childNodes:
+            if node.nodeType == node.TEXT_NODE:
+                rate = node.data
+                break
+        else:
+            raise Error("Unable to get currency rate for {}.", name)
+
+        date_rates[name] = (Decimal(rate.replace(",", ".")),) * 2
+
+    if not date_rates:
+        raise Error("Empty XML document gotten.")
+
+    return date_rates
+
+
+def test_parsing():
+    with open(os.path.join(DATA_PATH, "cbrf_daily.xml"), "rb") as xml_file:
+        xml_contents = xml_file.read()
+
+    rates = cbrf.parse_daily_rates(xml_contents)
+
+    assert rates == parse_with_minidom(xml_contents)
+    assert len(rates) == 34
+    assert rates["USD"] == (Decimal("72.9299"), Decimal("72.9299"))
+
+
+@pytest.mark.parametrize("xml_contents", [
+    b'<ValCurs><Valute><CharCode>USD</CharCode><Value>1,5</Value></Valute>'
+    b'<Valute><CharCode> EUR </CharCode><Nominal>1</Nominal><Value>2</Value></Valute></ValCurs>',
+    b'<?xml version="1.0" encoding="windows-1251"?>\n<ValCurs Date="01.01.2016">\n  '
+    b'<Valute ID="R01235">\n    <CharCode>USD</CharCode>\n    <Value>72,9299</Value>\n  </Valute>\n</ValCurs>',
+])
+def test_parsing_equivalence(xml_contents):
+    assert cbrf.parse_daily_rates(xml_contents) == parse_with_minidom(xml_contents)
+
+
+@pytest.mark.parametrize("xml_contents", [
+    b'<ValCurs></ValCurs>',
+    b'<ValCurs><Valute><CharCode></CharCode><Value>1</Value></Valute></ValCurs>',
+    b'<ValCurs><Valute><CharCode>USD</CharCode><Value/></Valute></ValCurs>',
+])
+def test_parsing_errors(xml_contents):
+    with pytest.raises(Error):
+        parse_with_minidom(xml_contents)
+
+    with pytest.raises(Error):
+        cbrf.parse_daily_rates(xml_contents)
+
+
+def test_period_rates(monkeypatch):
+    requests = []
+
+    def fetch(date, url):
+        requests.append(url)
+
+        # The same recorded series is used for all currencies
+        xml_name = "cbrf_dynamic.xml" if "XML_dynamic.asp" in url else "cbrf_daily.xml"
+        with open(os.path.join(DATA_PATH, xml_name), "rb") as xml_file:
+            return xml_file.read()
+
+    monkeypatch.setattr(cbrf, "_fetch", fetch)
+
+    dates = [datetime.date(2015, 12, 31) + datetime.timedelta(days) for days in range(21)]
+    rates = cbrf.get_rates_for_period(dates)
+
+    assert len(requests) == 1 + 34
+    assert requests[0].endswith("XML_daily.asp?date_req=20/01/2016")
+    assert requests[1].endswith("date_req1=17/12/2015&date_req2=20/01/2016&VAL_NM_RQ=R01010")
+
+    assert sorted(rates) == dates
+    assert all(len(day_rates) == 34 for day_rates in rates.values())
+
+    usd = {date: day_rates["USD"][0] for date, day_rates in rates.items()}
+    assert usd[datetime.date(2015, 12, 31)] == Decimal("72.9299")
+    assert usd[datetime.date(2016, 1, 11)] == Decimal("72.9299")
+    assert usd[datetime.date(2016, 1, 12)] == Decimal("75.9229")
+    assert usd[datetime.date(2016, 1, 18)] == Decimal("77.2264")
+    assert usd[datetime.date(2016, 1, 20)] == Decimal("79.0197")
+
+
+def test_dynamic_rates_parsing():
+    with open(os.path.join(DATA_PATH, "cbrf_dynamic.xml"), "rb") as xml_file:
+        records = cbrf.parse_dynamic_rates(xml_file.read())
+
+    assert len(records) == 11
+    assert records[0] == (datetime.date(2015, 12, 17), Decimal("70.9417"))
+    assert records[-1] == (datetime.date(2016, 1, 20), Decimal("79.0197"))
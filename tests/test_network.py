@@ -0,0 +1,67 @@
+import http.server
+import threading
+
+import pytest
+
+from requests import RequestException
+
+from pydeposits import constants
+from pydeposits import network
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    responses = []
+
+    def do_GET(self):
+        status = self.responses.pop(0) if self.responses else 200
+        body = b"OK" if status == 200 else b"Error"
+
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(constants, "HTTP_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(network, "_session", None)
+    monkeypatch.setattr(network, "_stats", {})
+    monkeypatch.setattr(Handler, "responses", [])
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    yield "127.0.0.1:{}".format(server.server_port)
+
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_fetch_url(server):
+    Handler.responses.extend((503, 502))
+    assert network.fetch_url("http://" + server + "/").content == b"OK"
+
+    Handler.responses.append(404)
+    with pytest.raises(RequestException) as error:
+        network.fetch_url("http://" + server + "/")
+    assert error.value.response.status_code == 404
+
+    stats = network.get_stats()[server]
+    assert (stats.requests, stats.failures, stats.bytes) == (2, 1, len("OK") + len("Error"))
+    assert network.get_downloaded_bytes() == stats.bytes
+
+
+def test_retries_limit(server):
+    Handler.responses.extend([503] * (constants.HTTP_RETRIES + 1))
+
+    with pytest.raises(RequestException):
+        network.fetch_url("http://" + server + "/")
+
+    assert Handler.responses == []
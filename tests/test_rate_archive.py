@@ -0,0 +1,473 @@
+import datetime
+import fcntl
+import multiprocessing
+import os
+import sqlite3
+import threading
+
+from decimal import Decimal
+
+import pytest
+
+from pydeposits import backfill
+from pydeposits import blob_store
+from pydeposits import rate_archive
+from pydeposits.rate_archive import MIN_RATE_ACCURACY, SCHEMA_VERSION, RateArchive
+from pydeposits.util import Error
+
+
+@pytest.fixture
+def archive(db_dir):
+    archive = RateArchive()
+    archive._RateArchive__add({
+        datetime.date(2016, 1, 1): {"USD": (Decimal("72.5"), Decimal("72.5"))},
+        datetime.date(2016, 1, 5): {"USD": (Decimal("73"), Decimal("73"))},
+        datetime.date(2016, 1, 9): {"USD": (Decimal("74"), Decimal("74")), "EUR": (Decimal("80"), Decimal("80"))},
+    })
+
+    return archive
+
+
+@pytest.mark.parametrize("date,rates", [
+    (datetime.date(2016, 1, 1), Decimal("72.5")),
+    (datetime.date(2016, 1, 2), Decimal("72.5")),
+    # The earlier date wins on equal distance
+    (datetime.date(2016, 1, 3), Decimal("72.5")),
+    (datetime.date(2016, 1, 4), Decimal("73")),
+    (datetime.date(2016, 1, 7), Decimal("73")),
+    (datetime.date(2016, 1, 19), Decimal("74")),
+    (datetime.date(2016, 1, 20), None),
+    (datetime.date(2015, 12, 22), Decimal("72.5")),
+    (datetime.date(2015, 12, 21), None),
+])
+def test_get_approx(archive, date, rates):
+    assert archive.get_approx("USD", date) == (None if rates is None else (rates, rates))
+
+
+def test_get_approx_local_currency(archive):
+    assert archive.get_approx("RUR", datetime.date(2000, 1, 1)) == (1, 1)
+
+
+def test_get_approx_many(archive):
+    requests = [
+        ("USD", datetime.date(2016, 1, 4)),
+        ("EUR", datetime.date(2016, 1, 4)),
+        ("RUR", datetime.date(2016, 1, 4)),
+        ("AUR_SBRF", datetime.date(2016, 1, 4)),
+    ]
+
+    assert archive.get_approx_many(requests) == {request: archive.get_approx(*request) for request in requests}
+    assert archive.get_approx_many(requests)[requests[1]] == (80, 80)
+
+
+def test_get_approx_todays_rates(archive, monkeypatch):
+    today = datetime.date.today()
+    monkeypatch.setattr(RateArchive, "_todays_rates", {"USD": (Decimal(1), Decimal(2))})
+
+    assert archive.get_approx("USD", today) == (1, 2)
+    assert archive.get_approx("USD", today - datetime.timedelta(MIN_RATE_ACCURACY)) == (1, 2)
+    assert archive.get_approx("EUR", today) is None
+
+
+def test_concurrent_access(archive):
+    dates = [datetime.date(2016, 2, 1) + datetime.timedelta(days) for days in range(30)]
+    requests = [("GBP", date) for date in dates] + [("USD", datetime.date(2016, 1, 1))]
+
+    stopped = threading.Event()
+    reads, errors = [], []
+
+    def read():
+        try:
+            while not stopped.is_set():
+                rates = RateArchive().get_approx_many(requests)
+                assert rates.pop(("USD", datetime.date(2016, 1, 1))) == (Decimal("72.5"), Decimal("72.5"))
+
+                # Each write is atomic, so all rates are from the same write
+                assert len(set(rates.values())) == 1
+                reads.append(rates[("GBP", dates[0])])
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(8)]
+    for reader in readers:
+        reader.start()
+
+    try:
+        for generation in range(1, 51):
+            archive._RateArchive__add({date: {"GBP": (Decimal(generation), Decimal(generation))} for date in dates})
+    finally:
+        stopped.set()
+        for reader in readers:
+            reader.join()
+
+    assert not errors
+    assert reads
+    assert archive.get_approx("GBP", dates[0]) == (50, 50)
+
+
+def test_external_changes(archive, db_dir):
+    date = datetime.date(2016, 1, 1)
+    assert archive.get_approx("USD", date) == (Decimal("72.5"), Decimal("72.5"))
+    archive.update()
+
+    # Another process adds history to the archive
+    db = sqlite3.connect(str(db_dir.join("rates.sqlite")))
+    db.execute("UPDATE rates SET sell_rate = 1000000, buy_rate = 1000000 WHERE currency = 'USD'")
+    db.commit()
+    db.close()
+
+    archive.update()
+    assert archive.get_approx("USD", date) == (1, 1)
+
+
+def test_legacy_schema_migration(db_dir):
+    db = sqlite3.connect(str(db_dir.join("rates.sqlite")))
+    db.execute("CREATE TABLE rates (day INTEGER, currency TEXT, sell_rate TEXT, buy_rate TEXT)")
+    db.execute("CREATE INDEX rate_index ON rates (day, currency)")
+    db.executemany("INSERT INTO rates VALUES (?, ?, ?, ?)", [
+        (16801, "USD", "72.5", "72.4"),
+        (16801, "USD", "1", "1"),
+        (16801, "AGR_SBRF", "41.550000000000004263256414560601115226745605468750", "34.45"),
+    ])
+    db.commit()
+    db.close()
+
+    archive = RateArchive()
+
+    assert RateArchive._db.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert RateArchive._db.execute("SELECT * FROM rates ORDER BY currency").fetchall() == [
+        ("AGR_SBRF", 16801, 41550000, 34450000),
+        ("USD", 16801, 72500000, 72400000),
+    ]
+    assert RateArchive._db.execute("SELECT source, day, status FROM fetch_log ORDER BY source").fetchall() == [
+        ("CBRF", 16801, "fetched"),
+        ("Sberbank metal", 16801, "fetched"),
+    ]
+
+    date = datetime.date(2016, 1, 1)
+    assert archive.get_approx("USD", date) == (Decimal("72.5"), Decimal("72.4"))
+
+    archive._RateArchive__add({date: {"USD": (Decimal("73"), Decimal("73"))}})
+    assert archive.get_approx("USD", date) == (Decimal("73"), Decimal("73"))
+
+
+def test_concurrent_initialization(db_dir, monkeypatch):
+    processes = 6
+    context = multiprocessing.get_context("fork")
+
+    for attempt in range(5):
+        monkeypatch.setattr(RateArchive, "_db_dir", str(db_dir.mkdir(str(attempt))))
+        barrier = context.Barrier(processes)
+
+        def open_archive():
+            barrier.wait()
+            RateArchive()
+
+        workers = [context.Process(target=open_archive) for _ in range(processes)]
+
+        for worker in workers:
+            worker.start()
+
+        for worker in workers:
+            worker.join()
+
+        assert [worker.exitcode for worker in workers] == [0] * processes
+
+
+class FakeSource:
+    def __init__(self, name, failed_dates=(), empty_dates=()):
+        self.NAME = name
+        self.requests = []
+        self.failed_dates = set(failed_dates)
+        self.empty_dates = set(empty_dates)
+
+    def get_rates_for_date(self, date):
+        self.requests.append(date)
+
+        if date in self.failed_dates:
+            raise Error("Failed to get rates for {}.", date)
+        elif date in self.empty_dates:
+            return {}
+
+        return {self.NAME: (Decimal(date.day), Decimal(date.day))}
+
+
+def test_update(db_dir, monkeypatch):
+    today = datetime.date.today()
+    dates = [today - datetime.timedelta(days) for days in range(10, -1, -1)]
+
+    sources = (FakeSource("A", failed_dates=dates[3:5]), FakeSource("B", empty_dates=dates[:2]))
+    monkeypatch.setattr(rate_archive, "_SOURCES", sources)
+    monkeypatch.setattr(rate_archive, "ARCHIVE_PERIOD_AT_FIRST_START", 10)
+    monkeypatch.setattr(RateArchive, "_offline_mode", False)
+
+    def update():
+        for source in sources:
+            del source.requests[:]
+
+        monkeypatch.setattr(RateArchive, "_todays_rates", None)
+        monkeypatch.setattr(RateArchive, "_indexes", {})
+        return RateArchive()
+
+    archive = update()
+    assert sorted(sources[0].requests) == dates
+    assert sorted(sources[1].requests) == dates
+    assert archive.get_approx("A", dates[3]) == (dates[2].day, dates[2].day)
+    assert archive.get_approx("A", today) == (today.day, today.day)
+    assert archive.get_approx("B", dates[0]) == (dates[2].day, dates[2].day)
+
+    # Only the failed days and today are requested again
+    sources[0].failed_dates.remove(dates[3])
+    archive = update()
+    assert sorted(sources[0].requests) == dates[3:5] + [today]
+    assert sources[1].requests == [today]
+    assert archive.get_approx("A", dates[3]) == (dates[3].day, dates[3].day)
+
+    # Failed days are retried only a limited number of times in a row
+    for attempt in range(rate_archive.FETCH_ATTEMPTS):
+        update()
+
+    assert sources[0].requests == [today]
+
+    # ... and then with an exponential backoff
+    for interval in (1, 2, 4):
+        RateArchive._db.execute("UPDATE fetch_log SET checked = checked - ?", (interval - 1,))
+        RateArchive._db.commit()
+        update()
+        assert sources[0].requests == [today]
+
+        RateArchive._db.execute("UPDATE fetch_log SET checked = checked - 1")
+        RateArchive._db.commit()
+        update()
+        assert sorted(sources[0].requests) == [dates[4], today]
+
+
+def test_update_empty_days(db_dir, monkeypatch):
+    today = datetime.date.today()
+    dates = [today - datetime.timedelta(days) for days in range(10, -1, -1)]
+    recent_date, old_date = dates[-2], dates[0]
+
+    source = FakeSource("A", empty_dates=(recent_date, old_date))
+    monkeypatch.setattr(rate_archive, "_SOURCES", (source,))
+    monkeypatch.setattr(rate_archive, "ARCHIVE_PERIOD_AT_FIRST_START", 10)
+    monkeypatch.setattr(RateArchive, "_offline_mode", False)
+
+    def update():
+        del source.requests[:]
+        monkeypatch.setattr(RateArchive, "_todays_rates", None)
+        RateArchive()
+        return source.requests
+
+    assert sorted(update()) == dates
+
+    # Days without data are checked at most once a day
+    assert update() == [today]
+
+    # The recent empty day may still get data
+    RateArchive._db.execute("UPDATE fetch_log SET checked = checked - 1")
+    RateArchive._db.commit()
+    assert sorted(update()) == [recent_date, today]
+
+    # ... until it's checked a few days later
+    RateArchive._db.execute("UPDATE fetch_log SET checked = day + ?", (rate_archive.EMPTY_DAY_FINALIZATION_DAYS,))
+    RateArchive._db.commit()
+    assert update() == [today]
+
+
+def test_todays_rates_cache(db_dir, monkeypatch):
+    today = datetime.date.today()
+
+    source = FakeSource("A")
+    monkeypatch.setattr(rate_archive, "_SOURCES", (source,))
+    monkeypatch.setattr(rate_archive, "ARCHIVE_PERIOD_AT_FIRST_START", 1)
+    monkeypatch.setattr(RateArchive, "_offline_mode", False)
+    monkeypatch.setattr(RateArchive, "_todays_rates_ttl", 60)
+
+    def update():
+        del source.requests[:]
+        monkeypatch.setattr(RateArchive, "_todays_rates", None)
+        return RateArchive()
+
+    yesterday = today - datetime.timedelta(1)
+
+    archive = update()
+    assert sorted(source.requests) == [yesterday, today]
+    assert archive.get_approx("A", today) == (today.day, today.day)
+    assert archive.get_stale_rates_time() is None
+
+    # Today's rates are served from the cache during the TTL
+    archive = update()
+    assert source.requests == []
+    assert archive.get_approx("A", today) == (today.day, today.day)
+
+    # Stale rates are used if they can't be updated
+    RateArchive._db.execute("UPDATE intraday_log SET updated = updated - 60")
+    RateArchive._db.commit()
+    source.failed_dates.add(today)
+
+    archive = update()
+    assert source.requests == [today]
+    assert archive.get_approx("A", today) == (today.day, today.day)
+    assert archive.get_stale_rates_time() is not None
+
+    # The failed source isn't requested again during the TTL
+    archive = update()
+    assert source.requests == []
+    assert archive.get_stale_rates_time() is not None
+
+    # ... and after a successful update they are up to date again
+    RateArchive._db.execute("UPDATE intraday_failures SET checked = checked - 60")
+    RateArchive._db.commit()
+    source.failed_dates.remove(today)
+    source.empty_dates.add(today)
+
+    archive = update()
+    assert source.requests == [today]
+    assert archive.get_approx("A", today) == (yesterday.day, yesterday.day)
+    assert archive.get_stale_rates_time() is None
+
+
+def test_stale_rates_with_zero_ttl(db_dir, monkeypatch):
+    today = datetime.date.today()
+
+    source = FakeSource("A")
+    monkeypatch.setattr(rate_archive, "_SOURCES", (source,))
+    monkeypatch.setattr(rate_archive, "ARCHIVE_PERIOD_AT_FIRST_START", 1)
+    monkeypatch.setattr(RateArchive, "_offline_mode", False)
+
+    def update():
+        monkeypatch.setattr(RateArchive, "_todays_rates", None)
+        return RateArchive()
+
+    # Rates are always downloaded, but they aren't stale right after a successful update
+    assert update().get_stale_rates_time() is None
+
+    source.failed_dates.add(today)
+    assert update().get_stale_rates_time() is not None
+
+    source.failed_dates.remove(today)
+    assert update().get_stale_rates_time() is None
+
+    # Without an update the TTL is used
+    monkeypatch.setattr(RateArchive, "_offline_mode", True)
+    assert update().get_stale_rates_time() is not None
+
+
+def test_background_update(db_dir, monkeypatch):
+    today = datetime.date.today()
+    yesterday = today - datetime.timedelta(1)
+
+    class BlockedSource(FakeSource):
+        def __init__(self, name):
+            super().__init__(name)
+            self.unblocked = threading.Event()
+
+        def get_rates_for_date(self, date):
+            assert self.unblocked.wait(5)
+            return super().get_rates_for_date(date)
+
+    source = BlockedSource("A")
+    monkeypatch.setattr(rate_archive, "_SOURCES", (source,))
+    monkeypatch.setattr(rate_archive, "ARCHIVE_PERIOD_AT_FIRST_START", 1)
+    monkeypatch.setattr(RateArchive, "_offline_mode", False)
+    monkeypatch.setattr(RateArchive, "_background_update", True)
+
+    # The local database is used while the update is in progress
+    archive = RateArchive()
+    assert archive.get_approx("A", yesterday) is None
+
+    source.unblocked.set()
+    RateArchive.wait_for_update()
+    assert sorted(source.requests) == [yesterday, today]
+    assert archive.get_approx("A", yesterday) == (yesterday.day, yesterday.day)
+
+    # Today's rates are saved for the next run
+    monkeypatch.setattr(RateArchive, "_todays_rates", None)
+    monkeypatch.setattr(RateArchive, "_update_thread", None)
+    monkeypatch.setattr(RateArchive, "_offline_mode", True)
+    assert RateArchive().get_approx("A", today) == (today.day, today.day)
+
+
+def test_update_lock(db_dir, monkeypatch):
+    today = datetime.date.today()
+
+    source = FakeSource("A")
+    monkeypatch.setattr(rate_archive, "_SOURCES", (source,))
+    monkeypatch.setattr(rate_archive, "ARCHIVE_PERIOD_AT_FIRST_START", 1)
+    monkeypatch.setattr(RateArchive, "_update_time_limit", 0.3)
+
+    RateArchive()
+    monkeypatch.setattr(RateArchive, "_offline_mode", False)
+    assert RateArchive._db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    # Another process is updating the database
+    with open(str(db_dir.join("rates.lock")), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        monkeypatch.setattr(RateArchive, "_todays_rates", None)
+        archive = RateArchive()
+        assert source.requests == []
+        assert archive.get_approx("A", today) is None
+
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    monkeypatch.setattr(RateArchive, "_todays_rates", None)
+    archive = RateArchive()
+    assert sorted(source.requests) == [today - datetime.timedelta(1), today]
+    assert archive.get_approx("A", today) == (today.day, today.day)
+
+
+def test_update_checkpoints(db_dir, monkeypatch):
+    today = datetime.date.today()
+    dates = [today - datetime.timedelta(days) for days in range(10, -1, -1)]
+
+    source = FakeSource("A")
+    monkeypatch.setattr(rate_archive, "_SOURCES", (source,))
+    monkeypatch.setattr(rate_archive, "ARCHIVE_PERIOD_AT_FIRST_START", 10)
+    monkeypatch.setattr(RateArchive, "_offline_mode", False)
+
+    download = backfill.download
+
+    def interrupted_download(jobs, max_workers, deadline=None):
+        for batch in download(jobs, 1, batch_size=4, deadline=deadline):
+            yield batch
+            raise Exception("Interrupted")
+
+    monkeypatch.setattr(backfill, "download", interrupted_download)
+
+    with pytest.raises(Error):
+        RateArchive()
+
+    checkpoint = [datetime.date.fromtimestamp(0) + datetime.timedelta(day)
+                  for day, in RateArchive._db.execute("SELECT day FROM fetch_log")]
+    # Today's rates aren't stored
+    assert len(checkpoint) in (3, 4)
+
+    del source.requests[:]
+    monkeypatch.setattr(backfill, "download", download)
+    RateArchive()
+
+    assert sorted(source.requests + checkpoint) == dates
+
+
+def test_reparse(db_dir):
+    data_path = os.path.dirname(__file__)
+    archive = RateArchive()
+
+    date = datetime.date(2016, 1, 4)
+    cbrf_url = "http://www.cbr.ru/scripts/XML_daily.asp?date_req=04/01/2016"
+    sbrf_url = "http://data.sberbank.ru/vk0104.xls"
+
+    for source, url, name in (
+        ("CBRF", cbrf_url, "cbrf_daily.xml"),
+        ("Sberbank currency", sbrf_url, "sberbank_currencies.xls"),
+    ):
+        with open(os.path.join(data_path, name), "rb") as response:
+            blob_store.save(source, date, url, response.read())
+
+    assert [response.url for response in blob_store.get_responses()] == [cbrf_url, sbrf_url]
+    assert archive.get_approx("USD", date) is None
+
+    assert archive.reparse(workers=2) == 0
+    assert archive.get_approx("USD", date) == (Decimal("72.9299"), Decimal("72.9299"))
+    assert archive.get_approx("EUR_SBRF", date) == (Decimal("82.65"), Decimal("76.55"))
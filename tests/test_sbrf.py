@@ -56,3 +56,76 @@ def test_receiving_all_history(data):
         date += datetime.timedelta(days=1)
 
     assert no_data_days < total_days / 2
+
+
+class FakeResponse:
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+
+def test_month_index_cache(tmpdir, monkeypatch):
+    requests = []
+    today = datetime.date.today()
+    current_month = today.replace(day=1)
+    past_month = datetime.date(2016, 1, 1)
+
+    def fetch_url(url, headers=None):
+        requests.append((url, headers))
+
+        if headers:
+            return FakeResponse(304)
+
+        month = past_month if "year115=2016" in url else current_month
+        return FakeResponse(200, '"/common/img/uploaded/banks/uploaded_mb/c_list/sdmet/download/'
+                                 '{0}/{1:02d}/dm{1:02d}01.xls"'.format(month.year, month.month), {"ETag": '"tag"'})
+
+    monkeypatch.setattr(sbrf, "fetch_url", fetch_url)
+    monkeypatch.setattr(sbrf, "_month_index_cache", sbrf._MonthIndexCache())
+    sbrf.set_cache_dir(str(tmpdir))
+
+    rates = sbrf._MetalRates()
+    assert rates._get_urls(past_month)
+    assert rates._get_urls(current_month)
+    assert len(requests) == 2
+
+    # Closed months are never requested again and the cache survives restarts
+    monkeypatch.setattr(sbrf, "_month_index_cache", sbrf._MonthIndexCache())
+    sbrf.set_cache_dir(str(tmpdir))
+
+    assert rates._get_urls(past_month + datetime.timedelta(days=1)) == []
+    assert rates._get_urls(current_month)
+    assert len(requests) == 2
+
+    # The current month is revalidated when TTL expires
+    monkeypatch.setattr(sbrf, "MONTH_INDEX_TTL", 0)
+
+    assert rates._get_urls(past_month)
+    assert rates._get_urls(current_month)
+    assert requests[2:] == [(requests[1][0], {"If-None-Match": '"tag"'})]
+
+
+def test_month_index_errors(tmpdir, monkeypatch):
+    requests = []
+    date = datetime.date(2016, 1, 1)
+
+    def fetch_url(url, headers=None):
+        requests.append(url)
+        return FakeResponse(200, "Service unavailable")
+
+    monkeypatch.setattr(sbrf, "fetch_url", fetch_url)
+    monkeypatch.setattr(sbrf, "_month_index_cache", sbrf._MonthIndexCache())
+    sbrf.set_cache_dir(str(tmpdir))
+
+    # A broken month index isn't requested again for each day of the month
+    rates = sbrf._MetalRates()
+    for day in range(3):
+        with pytest.raises(sbrf.Error):
+            rates._get_urls(date + datetime.timedelta(days=day))
+    assert len(requests) == 1
+
+    monkeypatch.setattr(sbrf, "MONTH_INDEX_RETRY_INTERVAL", 0)
+    with pytest.raises(sbrf.Error):
+        rates._get_urls(date)
+    assert len(requests) == 2
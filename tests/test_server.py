@@ -0,0 +1,92 @@
+import datetime
+import json
+import threading
+import urllib.error
+import urllib.request
+
+from decimal import Decimal
+
+import pytest
+
+from pydeposits import server
+from pydeposits.deposits import Holding
+from pydeposits.rate_archive import RateArchive
+
+DEPOSITS = [Holding(
+    bank="A",
+    open_date=datetime.date(2016, 1, 1),
+    close_date=datetime.date(2016, 3, 1),
+    currency="USD",
+    source_currency="RUR",
+    amount=Decimal(1000),
+    interest=Decimal(5),
+), Holding(
+    bank="B",
+    open_date=datetime.date(2016, 1, 1),
+    close_date=datetime.date(2016, 1, 10),
+    currency="RUR",
+    amount=Decimal(10000),
+    closed=True,
+)]
+
+
+@pytest.fixture
+def url(db_dir):
+    RateArchive()._RateArchive__add({
+        datetime.date(2016, 1, 1): {"USD": (Decimal(70), Decimal(69))},
+        datetime.date(2016, 2, 1): {"USD": (Decimal(75), Decimal(74))},
+    })
+
+    api_server = server.make_server(DEPOSITS, "127.0.0.1", 0)
+    thread = threading.Thread(target=api_server.serve_forever)
+    thread.start()
+
+    yield "http://127.0.0.1:{}".format(api_server.server_port)
+
+    api_server.shutdown()
+    api_server.server_close()
+    thread.join()
+
+
+def request(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, json.loads(response.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read().decode("utf-8"))
+
+
+def test_statement(url):
+    status, result = request(url + "/statement?today=01.02.2016")
+    assert status == 200
+    assert result["today"] == "01.02.2016"
+
+    holding, = result["holdings"]
+    assert holding["bank"] == "A"
+    assert holding["open_date"] == "01.01.2016"
+    assert (holding["closed"], holding["expired"]) == (False, False)
+    assert holding["cost"] == result["totals"]["cost"] == "74000"
+    assert holding["rate_profit"] == "4000"
+
+    status, result = request(url + "/statement?today=01.02.2016&all=1")
+    assert [(holding["bank"], holding["closed"]) for holding in result["holdings"]] == [("A", False), ("B", True)]
+
+
+def test_expiring(url):
+    status, result = request(url + "/expiring?days=30&today=01.02.2016")
+    assert status == 200
+    assert [holding["bank"] for holding in result["holdings"]] == ["A"]
+
+    status, result = request(url + "/expiring?days=-1")
+    assert status == 400
+    assert result["error"] == "Invalid number of days (-1)."
+
+
+def test_rates(url):
+    status, result = request(url + "/rates?currency=USD&date=30.01.2016")
+    assert status == 200
+    assert (result["currency"], result["date"]) == ("USD", "30.01.2016")
+    assert (Decimal(result["sell"]), Decimal(result["buy"])) == (75, 74)
+    assert request(url + "/rates?currency=EUR&date=30.01.2016")[1]["sell"] is None
+    assert request(url + "/rates?currency=USD&date=30.30.2016")[0] == 400
+    assert request(url + "/unknown")[0] == 404
@@ -0,0 +1,210 @@
+import datetime
+import json
+import random
+
+from decimal import Decimal
+
+import pytest
+
+from pydeposits import statements
+from pydeposits.deposits import Completion, Holding
+from pydeposits.rate_archive import RateArchive
+from pydeposits.util import Error
+
+from helpers import generate_holding, get_values
+
+DEPOSITS = [Holding(
+    bank="A",
+    open_date=datetime.date(2016, 1, 15),
+    close_date=datetime.date(2016, 4, 15),
+    currency="USD",
+    source_currency="RUR",
+    amount=Decimal(1000),
+    interest=Decimal(5),
+), Holding(
+    bank="B",
+    open_date=datetime.date(2016, 1, 31),
+    currency="RUR",
+    amount=Decimal(10000),
+    interest=Decimal("7.5"),
+    capitalization=Decimal(1),
+    completions=(
+        Completion(datetime.date(2016, 2, 10), Decimal(5000)),
+        Completion(datetime.date(2016, 3, 31), Decimal(1000)),
+    ),
+), Holding(
+    bank="C",
+    open_date=datetime.date(2016, 1, 1),
+    close_date=datetime.date(2016, 2, 1),
+    currency="RUR",
+    amount=Decimal(20000),
+    interest=Decimal(9),
+    closed=True,
+)]
+
+
+def calculate_current_amount_by_days(holding, today):
+    """The original day-by-day implementation of statements._calculate_current_amount()."""
+
+    open_date = holding.open_date
+
+    if holding.close_date is not None and holding.close_date < today:
+        to_date = holding.close_date
+    else:
+        to_date = today
+
+    per_day = (holding.interest or Decimal(0)) / 100 / statements._days_in_year(open_date.year)
+
+    profit = 0
+    amount = holding.amount
+
+    month = -1
+    cur_date = open_date
+    next_date = cur_date
+    completions = list(holding.completions or ())
+
+    while True:
+        if next_date > to_date:
+            next_date = to_date
+
+        if completions:
+            while cur_date <= next_date:
+                while completions and completions[0].date == cur_date:
+                    completion = completions.pop(0)
+                    amount += completion.amount
+
+                if cur_date == next_date:
+                    break
+
+                profit += amount * per_day
+                cur_date += datetime.timedelta(1)
+        else:
+            profit += amount * per_day * (next_date - cur_date).days
+            cur_date = next_date
+
+        if cur_date == to_date:
+            amount += profit
+            break
+
+        month += 1
+        if holding.capitalization is not None and month and month % holding.capitalization == 0:
+            amount += profit
+            profit = 0
+
+        next_date_year = cur_date.year
+        next_date_month = cur_date.month + 1
+        if next_date_month > 12:
+            next_date_year += 1
+            next_date_month = 1
+        next_date_day = open_date.day
+
+        while True:
+            try:
+                next_date = datetime.date(next_date_year, next_date_month, next_date_day)
+            except ValueError:
+                next_date_day -= 1
+                if next_date_day < 0:
+                    raise Error("Logical error.")
+            else:
+                break
+
+    return amount
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_current_amount(seed):
+    rand = random.Random(seed)
+
+    for _ in range(50):
+        holding = generate_holding(rand)
+        today = holding.open_date + datetime.timedelta(rand.randrange(4 * 365))
+
+        expected = calculate_current_amount_by_days(holding, today)
+        current_amount = statements._calculate_current_amount(holding, today)
+
+        if holding.completions:
+            # The day-by-day loop accumulates Decimal rounding errors differently
+            assert abs(current_amount - expected) < Decimal("1e-12"), holding
+        else:
+            assert current_amount == expected, holding
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_incremental_accrual(seed):
+    rand = random.Random(seed)
+
+    for _ in range(20):
+        holding = generate_holding(rand)
+        accrual = statements._Accrual(holding)
+
+        today = holding.open_date
+        for _ in range(30):
+            today += datetime.timedelta(rand.choice((0, 1, 1, 2, 7, 31, 100)))
+
+            expected = statements._calculate_current_amount(holding, today)
+            assert statements._calculate_current_amount(holding, today, accrual) == expected, (holding, today)
+
+
+@pytest.fixture
+def rates(db_dir):
+    RateArchive()._RateArchive__add({
+        datetime.date(2016, 1, 15): {"USD": (Decimal(70), Decimal(69))},
+        datetime.date(2016, 2, 1):  {"USD": (Decimal(75), Decimal(74))},
+        datetime.date(2016, 3, 1):  {"USD": (Decimal(65), Decimal(64))},
+    })
+
+
+@pytest.mark.parametrize("show_all", (False, True))
+def test_history(rates, show_all):
+    from_date, to_date = datetime.date(2015, 12, 25), datetime.date(2016, 5, 10)
+    history = list(statements.get_history(DEPOSITS, from_date, to_date, show_all))
+
+    assert [today for today, rows, totals in history] == [
+        from_date + datetime.timedelta(day) for day in range((to_date - from_date).days + 1)]
+
+    for today, rows, totals in history:
+        expected_rows, expected_totals = statements.get_account_statement(DEPOSITS, today, show_all)
+        assert [get_values(row) for row in rows] == [get_values(row) for row in expected_rows], today
+        assert totals == expected_totals, today
+
+
+def test_print_history(rates, capsys):
+    from_date, to_date = datetime.date(2016, 2, 1), datetime.date(2016, 2, 2)
+
+    statements.print_history(DEPOSITS, from_date, to_date, False)
+    assert capsys.readouterr().out.splitlines() == [
+        "date,cost,current_cost,pure_profit",
+        "01.02.2016,84000,84174,4174",
+        "02.02.2016,84000,84186,4186",
+    ]
+
+    statements.print_history(DEPOSITS, from_date, to_date, True, per_holding=True)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == ("date,bank,currency,open_date,close_date,closed,amount,cost,interest,rate_profit,"
+                        "current_amount,current_cost,pure_profit,pure_profit_percent")
+    assert lines[1] == "01.02.2016,B,RUR,31.01.2016,,,10000,10000,7.50,,10002,10002,2,"
+    assert len(lines) == 7
+
+    statements.print_history(DEPOSITS, from_date, from_date, False, per_holding=True, output_format="json")
+    history = json.loads(capsys.readouterr().out)
+    assert [(day["date"], day["cost"], len(day["holdings"])) for day in history] == [("01.02.2016", "84000", 2)]
+    assert history[0]["holdings"][1]["bank"] == "A"
+
+
+def test_valuation_context(rates):
+    context = statements.ValuationContext()
+
+    context.prefetch([("USD", datetime.date(2016, 2, 1)), ("USD", datetime.date(2016, 2, 1)),
+                      ("RUR", datetime.date(2016, 2, 1))])
+    assert (context.hits, context.misses) == (0, 2)
+
+    assert context.get_rates("USD", datetime.date(2016, 2, 1)) == (Decimal(75), Decimal(74))
+    assert context.get_rates("RUR", datetime.date(2016, 2, 1)) == (Decimal(1), Decimal(1))
+    assert (context.hits, context.misses) == (2, 2)
+
+    assert context.get_rates("USD", datetime.date(2016, 3, 2)) == (Decimal(65), Decimal(64))
+    assert context.get_rates("USD", datetime.date(2016, 3, 2)) == (Decimal(65), Decimal(64))
+    assert (context.hits, context.misses) == (3, 3)
+
+    context.prefetch([("USD", datetime.date(2016, 2, 1)), ("USD", datetime.date(2016, 3, 3))])
+    assert (context.hits, context.misses) == (3, 4)
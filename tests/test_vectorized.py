@@ -0,0 +1,115 @@
+import datetime
+import os
+import random
+import subprocess
+import sys
+
+from decimal import Decimal
+
+import pytest
+
+from pydeposits import constants, statements, vectorized
+from pydeposits.deposits import Completion, Holding
+
+from helpers import generate_holding, generate_rates, get_values
+
+pytest.importorskip("numpy")
+
+CURRENCIES = (constants.LOCAL_CURRENCY, "USD", "EUR")
+
+VALUE_ERROR = Decimal("0.005")
+"""Maximum difference between the values calculated by the vectorized and the Decimal engines."""
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_holding_info(seed):
+    rand = random.Random(seed)
+
+    holdings = []
+    rates = {}
+
+    for _ in range(200):
+        holding = generate_holding(rand, CURRENCIES, completions=False)
+        today = holding.open_date + datetime.timedelta(rand.randrange(4 * 365))
+        holdings.append((holding, today))
+
+        for date in (holding.open_date, today):
+            rates.setdefault((holding.currency, date), generate_rates(rand, holding.currency))
+
+    expected = [(statements.HoldingInfo(holding), today) for holding, today in holdings]
+    for info, today in expected:
+        statements._calculate_holding_info(info, today, statements.ValuationContext(rates))
+
+    assert all(vectorized.is_supported(holding) for holding, today in holdings)
+    infos = [(statements.HoldingInfo(holding), today) for holding, today in holdings]
+    vectorized.calculate_holding_info(infos, statements.ValuationContext(rates))
+
+    for (info, today), (expected_info, _) in zip(infos, expected):
+        values = get_values(info)
+
+        for key, value in get_values(expected_info).items():
+            if isinstance(value, Decimal):
+                assert abs(values[key] - value) < VALUE_ERROR, (key, info.holding)
+            else:
+                assert values[key] == value, (key, info.holding)
+
+
+def test_lazy_import():
+    # NumPy takes a while to import, so it's imported only when a large portfolio is valued
+    subprocess.check_call([sys.executable, "-c", "import sys, pydeposits.statements; assert 'numpy' not in sys.modules"],
+                          cwd=os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+def test_unsupported_holdings():
+    holding = Holding(bank="Bank", open_date=datetime.date(2012, 1, 1), currency="USD", amount=Decimal(100))
+    assert vectorized.is_supported(holding)
+
+    assert not vectorized.is_supported(holding._replace(source_currency="EUR"))
+    assert not vectorized.is_supported(holding._replace(completions=()))
+
+
+def test_account_statement(monkeypatch):
+    rand = random.Random(0)
+    today = datetime.date(2016, 1, 1)
+
+    holdings = []
+    for _ in range(100):
+        holding = generate_holding(rand, CURRENCIES, completions=False)
+        if holding.currency == constants.LOCAL_CURRENCY and rand.random() < 0.3:
+            holding = holding._replace(completions=(Completion(holding.open_date, Decimal(1000)),))
+        holdings.append(holding)
+
+    class RateArchive:
+        def get_approx_many(self, requests):
+            rand = random.Random(1)
+            return {(currency, date): generate_rates(rand, currency) for currency, date in requests}
+
+    monkeypatch.setattr(statements, "RateArchive", RateArchive)
+    monkeypatch.setattr(statements, "VECTORIZED_MIN_HOLDINGS", len(holdings))
+
+    # The vectorized engine must be enabled explicitly
+    with monkeypatch.context() as context:
+        context.setattr(vectorized, "calculate_holding_info", None)
+        expected = statements.get_account_statement(holdings, today, True)
+
+    rows, totals = statements.get_account_statement(holdings, today, True, use_numpy=True)
+
+    assert [row.holding for row in rows] == [row.holding for row in expected[0]]
+
+    for row, expected_row in zip(rows, expected[0]):
+        values = get_values(row)
+
+        for key, value in get_values(expected_row).items():
+            if value is None:
+                assert values[key] is None, (key, row.holding)
+            elif key in ("current_amount", "current_cost", "pure_profit", "cost", "rate_profit"):
+                # Rounded to integers, so the float error may change the last digit
+                assert abs(values[key] - value) <= 1, (key, row.holding)
+            elif key == "pure_profit_percent":
+                assert abs(values[key] - value) <= Decimal("0.01"), (key, row.holding)
+            else:
+                assert values[key] == value, (key, row.holding)
+
+    # Totals are sums of the unrounded values, so only their own rounding adds up to the values' error
+    for key, value in expected[1].items():
+        assert abs(totals[key] - value) <= 1 + len(holdings) * VALUE_ERROR, key
@@ -0,0 +1,57 @@
+import os
+
+import xlrd
+
+from pydeposits import xls
+
+DATA_PATH = os.path.dirname(__file__)
+
+TABLE_TEMPLATE = (
+    ("Курсы для проведения операций покупки и продажи наличной иностранной",),
+    ("валюты за наличную валюту Российской Федерации:",),
+    ("Наименование валют", "", "", "Масштаб", "Курс покупки", "Курс продажи"),
+)
+
+
+class FakeSheet:
+    def __init__(self, rows):
+        self.__rows = rows
+        self.nrows = len(rows)
+        self.ncols = max(len(row) for row in rows)
+
+    def row_values(self, row_id, start_column=0, end_column=None):
+        return list(self.__rows[row_id][start_column:end_column])
+
+    def row_types(self, row_id, start_column=0, end_column=None):
+        return [xlrd.XL_CELL_TEXT if value else xlrd.XL_CELL_EMPTY
+                for value in self.__rows[row_id][start_column:end_column]]
+
+
+def test_table_location_cache(monkeypatch):
+    monkeypatch.setattr(xls, "_table_locations", {})
+
+    scans = []
+    find_row = xls.find_row
+    monkeypatch.setattr(xls, "find_row", lambda *args: scans.append(args) or find_row(*args))
+
+    with open(os.path.join(DATA_PATH, "sberbank_currencies.xls"), "rb") as xls_file:
+        sheet = xlrd.open_workbook(file_contents=xls_file.read()).sheet_by_index(0)
+
+    location = xls.find_table(sheet, TABLE_TEMPLATE)
+    assert location == (6, 9, 0)
+    assert len(scans) == 1
+
+    assert xls.find_table(sheet, TABLE_TEMPLATE) == location
+    assert len(scans) == 1
+
+
+def test_table_location_cache_verification(monkeypatch):
+    monkeypatch.setattr(xls, "_table_locations", {})
+    monkeypatch.setattr(xls, "get_fingerprint", lambda sheet: "same")
+
+    rows = [("",) * 7] * 2 + [columns + ("",) * (7 - len(columns)) for columns in TABLE_TEMPLATE]
+    assert xls.find_table(FakeSheet(rows), TABLE_TEMPLATE) == (2, 5, 0)
+
+    # The cached location doesn't match the moved table, so the sheet must be scanned again
+    rows = [("",) * 7] + rows
+    assert xls.find_table(FakeSheet(rows), TABLE_TEMPLATE) == (3, 6, 0)